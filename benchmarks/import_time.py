@@ -0,0 +1,56 @@
+"""Time needed to import the package in a fresh interpreter, and what it
+loads, alone, for the headless runner and with a task class.
+
+    python benchmarks/import_time.py [number of runs]
+"""
+import json
+import statistics
+import subprocess
+import sys
+
+heavy = ["cv2", "matplotlib", "pandas", "ipywidgets", "notebook"]
+
+statements = [
+    "import dd_widgets",
+    "import dd_widgets.headless",
+    "import dd_widgets; dd_widgets.Classification",
+]
+
+script = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps([elapsed, [m for m in {heavy} if m in sys.modules]]))
+"""
+
+
+def measure(statement: str, n: int):
+    times = []
+    for _ in range(n):
+        out = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                script.format(statement=statement, heavy=heavy),
+            ],
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        elapsed, modules = json.loads(out.decode().splitlines()[-1])
+        times.append(elapsed)
+    return statistics.median(times), modules
+
+
+def main(n: int = 5) -> None:
+    for statement in statements:
+        elapsed, modules = measure(statement, n)
+        print(
+            "{:45s} {:7.1f} ms  loads: {}".format(
+                statement, 1000 * elapsed, ", ".join(modules) or "-"
+            )
+        )
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:]))
@@ -0,0 +1,39 @@
+"""Time needed to build Classification widgets, as in a dashboard notebook
+holding many of them.
+
+    python benchmarks/widget_construction.py [number of widgets]
+"""
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from dd_widgets import Classification
+
+
+def main(n: int = 40) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in ("cat", "dog"):
+            (Path(tmp) / label).mkdir()
+
+        start = time.perf_counter()
+        Classification("warmup", training_repo=tmp, testing_repo=tmp)
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for i in range(n):
+            Classification(
+                "bench{}".format(i), training_repo=tmp, testing_repo=tmp
+            )
+        elapsed = time.perf_counter() - start
+
+    print("first widget: {:.1f} ms".format(1000 * first))
+    print(
+        "{} widgets: {:.2f} s, {:.1f} ms per widget".format(
+            n, elapsed, 1000 * elapsed / n
+        )
+    )
+
+
+if __name__ == "__main__":
+    main(*(int(x) for x in sys.argv[1:]))
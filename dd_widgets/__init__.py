@@ -1,78 +1,135 @@
+import atexit
 import logging
+import logging.handlers
+import queue
+import threading
 from datetime import datetime
+from importlib import import_module
 from pathlib import Path
 
-import ipykernel
+# Task classes are imported on first access, and logging is set up when the
+# first widget is created: the headless runner only loads what it uses.
+_tasks = {
+    "Classification": ".classification",
+    "CSV": ".ddcsv",
+    "Detection": ".detection",
+    "OCR": ".ocr",
+    "Regression": ".regression",
+    "Segmentation": ".segmentation",
+    "Text": ".text",
+    "TSNE_CSV": ".tsne_csv",
+    "TSNE_Text": ".tsne_txt",
+}
 
-import requests
-from notebook import notebookapp
+__all__ = list(_tasks)
 
-from .classification import Classification  # noqa: F401
-from .ddcsv import CSV  # noqa: F401
-from .detection import Detection  # noqa: F401
-from .ocr import OCR  # noqa: F401
-from .regression import Regression  # noqa: F401
-from .segmentation import Segmentation  # noqa: F401
-from .text import Text  # noqa: F401
-from .tsne_csv import TSNE_CSV  # noqa: F401
-from .tsne_txt import TSNE_Text  # noqa: F401
-from .widgets import info_loghandler
 
+def __getattr__(name: str):
+    if name in _tasks:
+        return getattr(import_module(_tasks[name], __name__), name)
+    if name == "logfile_name":
+        return setup_logging()
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
 
-def notebook_path() -> Path:
+
+def __dir__():
+    return sorted(list(globals()) + __all__ + ["logfile_name"])
+
+
+def notebook_path(timeout: float = 2.0) -> Path:
     """Returns the absolute path of current notebook, or just a directory if not
     available. The method only works when the security is token-based or if
-    there is no password
+    there is no password. Each server is given `timeout` seconds to answer,
+    and the current directory is returned outside of a notebook.
     """
-    connection_file = Path(ipykernel.get_connection_file()).stem
+    import ipykernel
+    import requests
+    from notebook import notebookapp
+
+    try:
+        connection_file = Path(ipykernel.get_connection_file()).stem
+    except RuntimeError:  # not in a kernel
+        return Path.cwd()
     kernel_id = connection_file.split("-", 1)[1].split(".")[0]
 
+    directory = Path.cwd()
     for srv in notebookapp.list_running_servers():
+        directory = Path(srv["notebook_dir"])
         try:
             # No token and no password, ahem...
             if srv["token"] == "" and not srv["password"]:
                 path = srv["url"] + "api/sessions"
             else:
                 path = srv["url"] + "api/sessions?token=" + srv["token"]
-            c = requests.get(path)
+            c = requests.get(path, timeout=timeout)
             for sess in c.json():
                 if sess["kernel"]["id"] == kernel_id:
-                    return Path(srv["notebook_dir"]) / sess["notebook"]["path"]
+                    return directory / sess["notebook"]["path"]
         except Exception:
             pass  # There may be stale entries in the runtime directory
-    return Path(srv["notebook_dir"])
+    return directory
 
 
 def logfile(p: Path) -> Path:
+    """Name of the log file of a notebook, in a logs directory next to it"""
     if p.is_dir():
         dirname = p / "logs"
-        logname = dirname / f"{datetime.now():%Y-%m-%d}_widgets.log"
+        logname = dirname / f"{datetime.now():%Y-%m-%d}_widgets.jsonl"
     else:
         dirname = p.parent / "logs"
-        logname = dirname / (f"{datetime.now():%Y-%m-%d}_" + p.stem + ".log")
-
-    if not dirname.exists():
-        dirname.mkdir(parents=True)
+        logname = dirname / (f"{datetime.now():%Y-%m-%d}_" + p.stem + ".jsonl")
 
     return logname
 
 
-logfile_name = logfile(notebook_path()).as_posix()
+_logfile_name = None  # typing: Optional[str]
+_logging_lock = threading.Lock()
+
+
+def setup_logging(level: int = logging.INFO) -> str:
+    """Logs to a file next to the current notebook and to the INFO tab of
+    the widgets. Returns the name of the log file.
+
+    Records below `level` are not written to the file: at logging.DEBUG, it
+    also gets the reply of each poll of the trainings, every second. Only
+    the first call, before the first widget, sets it up."""
+    global _logfile_name
+    with _logging_lock:
+        if _logfile_name is None:
+            _logfile_name = _setup_logging(level)
+    return _logfile_name
+
+
+def _setup_logging(level: int) -> str:
+    from .loghandler import QueueHandler, ServiceFileHandler
+    from .widgets import info_loghandler
 
-# -- Logging --
+    logfile_name = logfile(notebook_path()).as_posix()
 
-fmt = "%(asctime)s:%(msecs)d - %(levelname)s"
-fmt += " - {%(filename)s:%(lineno)d} %(message)s"
+    fmt = "%(asctime)s:%(msecs)d - %(levelname)s"
+    fmt += " - {%(filename)s:%(lineno)d} %(message)s"
 
-file_handler = logging.FileHandler(logfile_name)
+    # records are written to the files by a listener thread
+    records = queue.SimpleQueue()  # typing: SimpleQueue[logging.LogRecord]
+    listener = logging.handlers.QueueListener(
+        records, ServiceFileHandler(logfile_name)
+    )
+    listener.start()
+    atexit.register(listener.stop)
+    # the records filtered here are never formatted, lazy payloads included
+    file_handler = QueueHandler(records)
+    file_handler.setLevel(level)
 
-logging.basicConfig(
-    format=fmt,
-    level=logging.DEBUG,
-    datefmt="%m-%d %H:%M:%S",
-    handlers=[file_handler, info_loghandler],
-)
+    logging.basicConfig(
+        format=fmt,
+        level=logging.DEBUG,
+        datefmt="%m-%d %H:%M:%S",
+        handlers=[file_handler, info_loghandler],
+    )
 
-info_loghandler.setLevel(logging.INFO)
+    info_loghandler.setLevel(logging.INFO)
 
-logging.info(f"Creating {logfile_name} file")
+    logging.info(f"Creating {logfile_name} file")
+    return logfile_name
@@ -0,0 +1,205 @@
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .imageinfo import image_size
+
+
+def bbox_files(list_file: Path) -> List[Tuple[str, str]]:
+    """(image, bbox file) pairs of a detection list file"""
+    return [
+        (line.split()[0], line.split()[1])
+        for line in Path(list_file).read_text().split("\n")
+        if len(line.split()) >= 2
+    ]
+
+
+def _parse_chunk(args):
+    offset, pairs = args
+    sizes = np.zeros((len(pairs), 2), dtype=np.int64)
+    boxes = []  # typing: List[np.ndarray]
+    unreadable = []  # typing: List[str]
+    for i, (image, bbox) in enumerate(pairs):
+        size = image_size(image)
+        if size is None:
+            unreadable.append(image)
+            sizes[i] = -1
+        else:
+            sizes[i] = size
+        try:
+            with open(bbox, "r") as fh:
+                values = np.array(fh.read().split(), dtype=np.float64)
+        except (OSError, ValueError):
+            unreadable.append(bbox)
+            continue
+        values = values[: len(values) - len(values) % 5].reshape(-1, 5)
+        boxes.append(
+            np.concatenate(
+                [np.full((len(values), 1), offset + i, np.float64), values],
+                axis=1,
+            )
+        )
+    boxes.append(np.empty((0, 6)))
+    return sizes, np.concatenate(boxes), unreadable
+
+
+class BoxStatistics(NamedTuple):
+    # columns: image index, class, xmin, ymin, xmax, ymax
+    boxes: np.ndarray
+    # (width, height) for each image as decoded, after its Exif orientation,
+    # -1 when unreadable
+    image_sizes: np.ndarray
+    unreadable: List[str]
+
+    @property
+    def widths(self) -> np.ndarray:
+        return self.boxes[:, 4] - self.boxes[:, 2]
+
+    @property
+    def heights(self) -> np.ndarray:
+        return self.boxes[:, 5] - self.boxes[:, 3]
+
+    @property
+    def class_counts(self) -> np.ndarray:
+        return np.bincount(self.boxes[:, 1].astype(np.int64))
+
+    def degenerate(self) -> np.ndarray:
+        return (self.widths <= 0) | (self.heights <= 0)
+
+    def out_of_image(self) -> np.ndarray:
+        size = self.image_sizes[self.boxes[:, 0].astype(np.int64)]
+        known = size[:, 0] > 0
+        return known & (
+            (self.boxes[:, 2] < 0)
+            | (self.boxes[:, 3] < 0)
+            | (self.boxes[:, 4] > size[:, 0])
+            | (self.boxes[:, 5] > size[:, 1])
+        )
+
+    def duplicates(self) -> int:
+        """Number of boxes repeating another box of the same image"""
+        return len(self.boxes) - len(np.unique(self.boxes, axis=0))
+
+    def size_histogram(self, bins: int = 20) -> Tuple[np.ndarray, np.ndarray]:
+        """Histogram of sqrt(width * height), with logarithmic bins"""
+        valid = ~self.degenerate()
+        size = np.sqrt(self.widths[valid] * self.heights[valid])
+        if len(size) == 0:
+            return np.zeros(bins, np.int64), np.zeros(bins + 1)
+        edges = np.geomspace(max(1.0, size.min()), size.max() + 1, bins + 1)
+        return np.histogram(size, edges)
+
+    def aspect_histogram(
+        self, bins: int = 20
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Histogram of width / height, with logarithmic bins"""
+        valid = ~self.degenerate()
+        ratio = self.widths[valid] / self.heights[valid]
+        if len(ratio) == 0:
+            return np.zeros(bins, np.int64), np.zeros(bins + 1)
+        edges = np.geomspace(ratio.min(), ratio.max() * 1.0001, bins + 1)
+        return np.histogram(ratio, edges)
+
+    def small_fraction(
+        self, candidates: Iterable[Tuple[int, int]], min_pixels: int = 8
+    ) -> List[Tuple[int, int, float]]:
+        """Fraction of the boxes whose width or height falls below
+        min_pixels when images are resized to each (db_width, db_height).
+
+        A null size stands for the original image size.
+        """
+        size = self.image_sizes[self.boxes[:, 0].astype(np.int64)]
+        known = (size[:, 0] > 0) & ~self.degenerate()
+        w, h = self.widths[known], self.heights[known]
+        size = size[known].astype(np.float64)
+        result = []  # typing: List[Tuple[int, int, float]]
+        for db_width, db_height in candidates:
+            sx = db_width / size[:, 0] if db_width > 0 else 1.0
+            sy = db_height / size[:, 1] if db_height > 0 else 1.0
+            small = (w * sx < min_pixels) | (h * sy < min_pixels)
+            result.append(
+                (
+                    db_width,
+                    db_height,
+                    float(small.mean()) if len(small) > 0 else 0.0,
+                )
+            )
+        return result
+
+    def summary(
+        self,
+        candidates: Iterable[Tuple[int, int]] = (
+            (0, 0),
+            (300, 300),
+            (512, 512),
+            (1024, 1024),
+        ),
+        min_pixels: int = 8,
+    ) -> str:
+        lines = [
+            "{} boxes in {} images".format(
+                len(self.boxes), len(self.image_sizes)
+            ),
+            "Boxes per class: "
+            + ", ".join(
+                "{}: {}".format(c, n)
+                for c, n in enumerate(self.class_counts)
+                if n > 0
+            ),
+            "{} degenerate, {} out of image, {} duplicate boxes".format(
+                int(self.degenerate().sum()),
+                int(self.out_of_image().sum()),
+                self.duplicates(),
+            ),
+        ]
+        for name, (counts, edges) in (
+            ("Box size (sqrt(w*h))", self.size_histogram(10)),
+            ("Aspect ratio (w/h)", self.aspect_histogram(10)),
+        ):
+            lines.append(name + ":")
+            for n, lo, hi in zip(counts, edges[:-1], edges[1:]):
+                lines.append("  [{:8.2f}, {:8.2f}) {}".format(lo, hi, n))
+        lines.append(
+            "Boxes smaller than {} pixels after resizing:".format(min_pixels)
+        )
+        for db_width, db_height, fraction in self.small_fraction(
+            candidates, min_pixels
+        ):
+            lines.append(
+                "  {}: {:.2%}".format(
+                    "{}x{}".format(db_width, db_height)
+                    if db_width > 0 or db_height > 0
+                    else "original size",
+                    fraction,
+                )
+            )
+        if self.unreadable:
+            lines.append("{} unreadable files".format(len(self.unreadable)))
+        return "\n".join(lines)
+
+
+def box_statistics(
+    list_file: Path, processes: Optional[int] = None, chunksize: int = 256
+) -> BoxStatistics:
+    """Parses all bbox files of a detection list file (in a process pool)
+    into a single array of boxes"""
+    pairs = bbox_files(list_file)
+    chunks = [
+        (k, pairs[k : k + chunksize]) for k in range(0, len(pairs), chunksize)
+    ]
+    sizes = [np.empty((0, 2), np.int64)]  # typing: List[np.ndarray]
+    boxes = [np.empty((0, 6))]  # typing: List[np.ndarray]
+    unreadable = []  # typing: List[str]
+    if len(chunks) > 0:
+        with Pool(processes) as pool:
+            for c_sizes, c_boxes, c_unreadable in pool.map(
+                _parse_chunk, chunks
+            ):
+                sizes.append(c_sizes)
+                boxes.append(c_boxes)
+                unreadable += c_unreadable
+    return BoxStatistics(
+        np.concatenate(boxes), np.concatenate(sizes), unreadable
+    )
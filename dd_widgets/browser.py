@@ -0,0 +1,300 @@
+import fnmatch
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, List, Optional
+
+import numpy as np
+
+import cv2
+from ipywidgets import (Button, Dropdown, HBox, Image, IntText, Label, Layout,
+                        SelectMultiple, Text, VBox)
+
+from .imageinfo import image_size, reduced_flag
+from .scanning import Debouncer
+
+
+class FileIndex:
+    """Listing of a dataset which can be filtered, sorted and paged through.
+    File sizes are only read when a size filter or sort needs them."""
+
+    def __init__(self, paths: List[str]) -> None:
+        self.paths = paths
+        self._sizes = None  # typing: Optional[np.ndarray]
+
+    @classmethod
+    def from_directory(cls, directory: Path) -> "FileIndex":
+        paths = []  # typing: List[str]
+        for root, _, files in os.walk(str(directory)):
+            paths += (os.path.join(root, f) for f in files)
+        paths.sort()
+        return cls(paths)
+
+    def __len__(self) -> int:
+        return len(self.paths)
+
+    @property
+    def sizes(self) -> np.ndarray:
+        if self._sizes is None:
+            self._sizes = np.fromiter(
+                (
+                    os.stat(p).st_size if os.path.exists(p) else -1
+                    for p in self.paths
+                ),
+                dtype=np.int64,
+                count=len(self.paths),
+            )
+        return self._sizes
+
+    def select(
+        self,
+        pattern: str = "",
+        min_size: int = 0,
+        max_size: int = 0,
+        sort: str = "name",
+        reverse: bool = False,
+    ) -> np.ndarray:
+        """Indices of the files matching the filters, in the requested order.
+
+        The pattern is a glob on the file name if it contains wildcards, a
+        substring otherwise. Sizes are in bytes, 0 meaning no bound.
+        """
+        if pattern == "":
+            keep = np.ones(len(self.paths), dtype=bool)
+        elif any(c in pattern for c in "*?["):
+            keep = np.fromiter(
+                (
+                    fnmatch.fnmatch(os.path.basename(p), pattern)
+                    for p in self.paths
+                ),
+                dtype=bool,
+                count=len(self.paths),
+            )
+        else:
+            keep = np.fromiter(
+                (pattern in os.path.basename(p) for p in self.paths),
+                dtype=bool,
+                count=len(self.paths),
+            )
+        if min_size > 0:
+            keep &= self.sizes >= min_size
+        if max_size > 0:
+            keep &= self.sizes <= max_size
+        indices = np.flatnonzero(keep)
+        if sort == "size":
+            indices = indices[np.argsort(self.sizes[indices], kind="stable")]
+        if reverse:
+            indices = indices[::-1]
+        return indices
+
+
+def thumbnail(path: str, side: int = 128) -> bytes:
+    """PNG thumbnail, decoded at reduced resolution when possible"""
+    size = image_size(path)
+    if size is None:
+        return b""
+    scale = min(1.0, side / max(size))
+    new = max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+    data = cv2.imread(path, reduced_flag(size[0], size[1], *new))
+    if data is None:
+        return b""
+    data = cv2.resize(data, new, interpolation=cv2.INTER_AREA)
+    return cv2.imencode(".png", data)[1].tobytes()
+
+
+class PreviewCache:
+    """Bounded cache of previews rendered by a background thread"""
+
+    def __init__(self, render: Callable[[str], bytes], capacity: int = 40):
+        self.render = render
+        self.capacity = capacity
+        self._cache = OrderedDict()  # typing: OrderedDict[str, Future]
+        self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def _future(self, path: str) -> Future:
+        if path in self._cache:
+            self._cache.move_to_end(path)
+        else:
+            self._cache[path] = self._executor.submit(self.render, path)
+            while len(self._cache) > self.capacity:
+                _, future = self._cache.popitem(last=False)
+                future.cancel()
+        return self._cache[path]
+
+    def get(self, path: str) -> bytes:
+        try:
+            return self._future(path).result()
+        except Exception:
+            return b""
+
+    def when_ready(self, path: str, callback: Callable[[bytes], None]):
+        """Calls callback with the preview once rendered, from the rendering
+        thread, or right away if it already is"""
+
+        def done(future: Future) -> None:
+            if future.cancelled() or future.exception() is not None:
+                callback(b"")
+            else:
+                callback(future.result())
+
+        self._future(path).add_done_callback(done)
+
+    def prefetch(self, paths: List[str]) -> None:
+        for path in paths:
+            self._future(path)
+
+
+class DatasetBrowser:
+    """Paginated view of a FileIndex feeding an existing file list widget,
+    with thumbnails of the current page and prefetch of the next one"""
+
+    sort_options = ["name", "name (desc)", "size", "size (desc)"]
+
+    def __init__(
+        self,
+        file_list: SelectMultiple,
+        page_size: int = 10,
+        render: Optional[Callable[[str], bytes]] = thumbnail,
+    ) -> None:
+        self.file_list = file_list
+        self.page_size = page_size
+        self.index = FileIndex([])
+        self.selection = np.empty(0, dtype=np.int64)
+        self.page = 0
+        # refreshes come from the kernel and from the debouncer's timer
+        self._lock = threading.RLock()
+        self._listing = ThreadPoolExecutor(max_workers=1)
+        self._directory = None  # typing: Optional[Path], being listed
+
+        self.sort = Dropdown(
+            options=self.sort_options, layout=Layout(width="120px")
+        )
+        self.pattern = Text(
+            placeholder="filter name", layout=Layout(width="150px")
+        )
+        self.min_kb = IntText(
+            value=0, description="KB min", layout=Layout(width="130px")
+        )
+        self.max_kb = IntText(
+            value=0, description="KB max", layout=Layout(width="130px")
+        )
+        self.prev_button = Button(description="<", layout={"width": "40px"})
+        self.next_button = Button(description=">", layout={"width": "40px"})
+        self.page_label = Label()
+
+        self.sort.observe(self.refresh, names="value")
+        # each keystroke would filter the whole index
+        self.pattern.observe(Debouncer(self.refresh), names="value")
+        self.min_kb.observe(self.refresh, names="value")
+        self.max_kb.observe(self.refresh, names="value")
+        self.prev_button.on_click(self.prev_page)
+        self.next_button.on_click(self.next_page)
+
+        children = [
+            HBox([self.sort, self.pattern, self.min_kb, self.max_kb]),
+            HBox([self.prev_button, self.next_button, self.page_label]),
+            self.file_list,
+        ]
+
+        self.previews = None  # typing: Optional[PreviewCache]
+        self.images = []  # typing: List[Image]
+        self._shown = []  # typing: List[Optional[str]], path of each image
+        if render is not None:
+            self.previews = PreviewCache(render, 4 * page_size)
+            # one widget per slot of the page, whatever the dataset size
+            self.images = [
+                Image(layout=Layout(max_width="110px", max_height="110px"))
+                for _ in range(page_size)
+            ]
+            children.append(HBox(self.images, layout={"flex_flow": "wrap"}))
+
+        self.box = VBox(children)
+
+    def load(self, index: FileIndex) -> None:
+        with self._lock:
+            self._directory = None  # supersedes a directory being listed
+            self.index = index
+            self.refresh()
+
+    def load_directory(self, directory: Path) -> None:
+        """Loads the files of a directory, listed in a background thread"""
+        with self._lock:
+            self._directory = directory
+            self.page_label.value = "listing {}...".format(directory)
+        future = self._listing.submit(FileIndex.from_directory, directory)
+
+        def done(future: Future) -> None:
+            with self._lock:
+                if self._directory != directory:
+                    return  # another listing or index was loaded since
+                if future.exception() is not None:
+                    self._directory = None
+                    self.page_label.value = str(future.exception())
+                    return
+                self.load(future.result())
+
+        future.add_done_callback(done)
+
+    def refresh(self, *_) -> None:
+        with self._lock:
+            sort = self.sort.value
+            self.selection = self.index.select(
+                self.pattern.value,
+                1024 * self.min_kb.value,
+                1024 * self.max_kb.value,
+                sort=sort.split()[0],
+                reverse=sort.endswith("(desc)"),
+            )
+            self.show(0)
+
+    @property
+    def npages(self) -> int:
+        return max(1, -(-len(self.selection) // self.page_size))
+
+    def page_paths(self, page: int) -> List[str]:
+        start = page * self.page_size
+        return [
+            self.index.paths[i]
+            for i in self.selection[start : start + self.page_size]
+        ]
+
+    def show(self, page: int) -> None:
+        with self._lock:
+            self._show(page)
+
+    def _show(self, page: int) -> None:
+        self.page = min(max(0, page), self.npages - 1)
+        paths = self.page_paths(self.page)
+        self.file_list.options = paths
+        self.page_label.value = "page {} / {} ({} files)".format(
+            self.page + 1, self.npages, len(self.selection)
+        )
+        if self.previews is not None:
+            self.previews.prefetch(paths)
+            slots = paths + [None] * (self.page_size - len(paths))
+            self._shown = slots
+            for slot, (image, path) in enumerate(zip(self.images, slots)):
+                image.value = b""  # until the thumbnail is rendered
+                image.layout.display = None if path is not None else "none"
+                if path is not None:
+                    self.previews.when_ready(
+                        path, self._set_image(slot, path)
+                    )
+            if self.page + 1 < self.npages:
+                self.previews.prefetch(self.page_paths(self.page + 1))
+
+    def _set_image(self, slot: int, path: str) -> Callable[[bytes], None]:
+        def set_image(value: bytes) -> None:
+            # the page may have changed while rendering
+            if self._shown[slot] == path:
+                self.images[slot].value = value
+
+        return set_image
+
+    def prev_page(self, *_) -> None:
+        self.show(self.page - 1)
+
+    def next_page(self, *_) -> None:
+        self.show(self.page + 1)
@@ -0,0 +1,12 @@
+import hashlib
+from pathlib import Path
+
+
+def cache_path(kind: str, *key: str, suffix: str = ".npz") -> Path:
+    """Location of a cache file in ~/.cache/dd_widgets/<kind>/ identified by
+    its key (typically the path of a dataset)"""
+    digest = hashlib.sha1("\0".join(key).encode("utf-8")).hexdigest()
+    dirname = Path.home() / ".cache" / "dd_widgets" / kind
+    if not dirname.exists():
+        dirname.mkdir(parents=True)
+    return dirname / (digest + suffix)
@@ -1,4 +1,3 @@
-import json
 import logging
 import os
 import random
@@ -9,14 +8,16 @@ from pathlib import Path
 from tempfile import mkstemp
 from typing import Iterator, Optional, Tuple, TypeVar
 
-import matplotlib.pyplot as plt
 from IPython.display import Image
-from matplotlib import patches
-from matplotlib.cm import get_cmap
 
 import cv2
 from ipywidgets import Button, HBox, SelectMultiple
 
+from .browser import DatasetBrowser, FileIndex
+from .imageinfo import image_size, oriented, reduced_flag
+from .loghandler import LazyJSON
+from .phash import image_duplicates
+from .resize import resize_dataset
 from .widgets import MLWidget
 
 
@@ -68,14 +69,58 @@ class ImageTrainerMixin(MLWidget):
             self.test_labels.on_click(self.update_test_file_list)
             self.file_list.observe(self.display_img, names="value")
 
+        self.duplicates_button = Button(description="Find duplicates")
+        self.duplicates_button.on_click(self.duplicates)
+
+        self.browser = DatasetBrowser(self.file_list)
+
         self._img_explorer.children = [
             HBox([HBox([self.train_labels, self.test_labels])]),
-            self.file_list,
+            self.scan_status,
+            self.duplicates_button,
+            self.browser.box,
             self.output,
         ]
 
         self.update_label_list(())
 
+    def duplicates(self, *_):
+        self.output.clear_output()
+        with self.output:
+            report = image_duplicates(
+                Path(self.training_repo.value),
+                Path(self.testing_repo.value)
+                if self.testing_repo.value
+                else None,
+            )
+            print(report.summary())
+            return report
+
+    def resize_mirror(self, dst: Path, max_side: Optional[int] = None):
+        """Resizes the dataset locally into dst, either to fit max_side or to
+        exactly img_width x img_height, and points training_repo and
+        testing_repo to the mirror so that the server builds its database
+        from small images"""
+        kind = {"Detection": "bbox", "Segmentation": "mask"}.get(
+            self.__class__.__name__, "image"
+        )
+        size = None
+        if max_side is None:
+            if self.img_width.value == "" or self.img_height.value == "":
+                raise ValueError(
+                    "Set img_width and img_height, or give a max_side"
+                )
+            size = (int(self.img_width.value), int(self.img_height.value))
+        with self.output:
+            for repo in (self.training_repo, self.testing_repo):
+                if repo.value == "":
+                    continue
+                report = resize_dataset(
+                    Path(repo.value), dst, kind, max_side, size
+                )
+                print(report.summary())
+                repo.value = report.repo.as_posix()
+
     def update_train_file_list(self, *args):
         with self.output:
             # print (Path(self.training_repo.value).read_text().split('\n'))
@@ -85,10 +130,9 @@ class ImageTrainerMixin(MLWidget):
                 if len(x.split()) >= 2
             }
 
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(self.file_dict.keys(), 10)
-            ]
+            self.browser.load(
+                FileIndex([fh.as_posix() for fh in self.file_dict.keys()])
+            )
 
     def update_test_file_list(self, *args):
         with self.output:
@@ -99,10 +143,9 @@ class ImageTrainerMixin(MLWidget):
                 if len(x.split()) >= 2
             }
 
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(self.file_dict.keys(), 10)
-            ]
+            self.browser.load(
+                FileIndex([fh.as_posix() for fh in self.file_dict.keys()])
+            )
 
     def update_train_dir_list(self, *args):
         with self.output:
@@ -111,10 +154,7 @@ class ImageTrainerMixin(MLWidget):
             directory = (
                 Path(self.training_repo.value) / self.train_labels.value[0]
             )
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(directory.glob("**/*"), 10)
-            ]
+            self.browser.load_directory(directory)
             self.test_labels.value = []
 
     def update_test_dir_list(self, *args):
@@ -124,10 +164,7 @@ class ImageTrainerMixin(MLWidget):
             directory = (
                 Path(self.testing_repo.value) / self.test_labels.value[0]
             )
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(directory.glob("**/*"), 10)
-            ]
+            self.browser.load_directory(directory)
             self.train_labels.value = []
 
     def _create_service_body(self):
@@ -137,7 +174,7 @@ class ImageTrainerMixin(MLWidget):
 
         nclasses = int(self.nclasses.value)
         if nclasses == -1:
-            nclasses = len(os.walk(self.training_repo.value).next()[1])
+            nclasses = len(next(os.walk(self.training_repo.value))[1])
 
         logging.info("{} classes".format(nclasses))
         description = self.description.value
@@ -183,11 +220,7 @@ class ImageTrainerMixin(MLWidget):
         if self.ctc.value:
             parameters_input["ctc"] = True
 
-        logging.info(
-            "Parameters input: {}".format(
-                json.dumps(parameters_input, indent=2)
-            )
-        )
+        logging.info("Parameters input: %s", LazyJSON(parameters_input))
 
         if not self.finetune.value:
             if self.template.value:
@@ -300,11 +333,11 @@ class ImageTrainerMixin(MLWidget):
                 del parameters_mllib["geometry"]
                 
         parameters_mllib["gpu"] = True
-        assert len(self.gpuid.index) > 0, "Set a GPU index"
+        assert len(self.gpuid.gpu_ids) > 0, "Set a GPU index"
         parameters_mllib["gpuid"] = (
-            list(self.gpuid.index)
-            if len(self.gpuid.index) > 1
-            else self.gpuid.index[0]
+            list(self.gpuid.gpu_ids)
+            if len(self.gpuid.gpu_ids) > 1
+            else self.gpuid.gpu_ids[0]
         )
         if self.regression.value:
             parameters_mllib["regression"] = True
@@ -319,11 +352,7 @@ class ImageTrainerMixin(MLWidget):
             parameters_mllib["db"] = False
             parameters_mllib["finetuning"] = False
 
-        logging.info(
-            "Parameters mllib: {}".format(
-                json.dumps(parameters_mllib, indent=2)
-            )
-        )
+        logging.info("Parameters mllib: %s", LazyJSON(parameters_mllib))
 
         parameters_output = {"store_config": True}
         # print (parameters_input)
@@ -376,13 +405,13 @@ class ImageTrainerMixin(MLWidget):
             if self.align.value:
                 parameters_input["align"] = True
 
-        assert len(self.gpuid.index) > 0, "Set a GPU index"
+        assert len(self.gpuid.gpu_ids) > 0, "Set a GPU index"
         parameters_mllib = {
             "gpu": True,
             "gpuid": (
-                list(self.gpuid.index)
-                if len(self.gpuid.index) > 1
-                else self.gpuid.index[0]
+                list(self.gpuid.gpu_ids)
+                if len(self.gpuid.gpu_ids) > 1
+                else self.gpuid.gpu_ids[0]
             ),
             "resume": self.resume.value,
             "net": {
@@ -479,18 +508,50 @@ def img_handle(
     bbox: Optional[Path] = None,
     nclasses: int = -1,
     imread_args: tuple = tuple(),
+    preview_size: int = 640,
 ) -> Tuple[Tuple[int, ...], Image]:
 
+    import matplotlib.pyplot as plt
+    from matplotlib import patches
+    from matplotlib.cm import get_cmap
+
     if not path.exists():
         raise ValueError("File {} does not exist".format(path))
-    data = cv2.imread(path.as_posix(), *imread_args)
+
+    # The preview is decoded at a reduced resolution, no larger than needed
+    # for preview_size pixels, and drawn at the full resolution of the header.
+    size = image_size(path)
+    if size is not None and imread_args in (
+        tuple(),
+        (cv2.IMREAD_COLOR,),
+        (cv2.IMREAD_GRAYSCALE,),
+    ):
+        scale = min(1.0, preview_size / max(size))
+        flag = reduced_flag(
+            size[0],
+            size[1],
+            size[0] * scale,
+            size[1] * scale,
+            grayscale=imread_args == (cv2.IMREAD_GRAYSCALE,),
+        )
+        data = cv2.imread(path.as_posix(), flag)
+    else:
+        data = cv2.imread(path.as_posix(), *imread_args)
+    if size is None:
+        size = data.shape[1], data.shape[0]
+    size = oriented(size, data.shape)  # as rotated by cv2.imread
+    shape = (size[1], size[0]) + data.shape[2:]
+    # full resolution coordinates, for masks and boxes
+    extent = (-0.5, size[0] - 0.5, size[1] - 0.5, -0.5)
+
     _, fname = mkstemp(suffix=".png")
     fig, ax = plt.subplots()
-    ax.imshow(data)
+    ax.imshow(data, extent=extent)
     if segmentation is not None:
         # DO NOT CHANGE the option for segmentation: PLEASE!!
         data = cv2.imread(segmentation.as_posix(), cv2.IMREAD_UNCHANGED)
-        ax.imshow(data, alpha=.8)
+        shape = data.shape  # of the mask, as before
+        ax.imshow(data, alpha=.8, extent=extent)
         if data.max() >= nclasses > -1:
             raise RuntimeError(
                 "Index {max} present in {filename}".format(
@@ -525,4 +586,4 @@ def img_handle(
 
     fig.savefig(fname)
     plt.close(fig)
-    return data.shape, Image(fname)
+    return shape, Image(fname)
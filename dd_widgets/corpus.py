@@ -0,0 +1,212 @@
+import os
+import re
+from collections import Counter
+from itertools import islice
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+word_re = re.compile(r"\w+")
+
+_cache = {}  # typing: Dict[Tuple, Tuple[Tuple, CorpusProfile]]
+
+
+class CorpusProfile(NamedTuple):
+    """ Statistics over a text corpus laid out as one directory per label """
+
+    class_counts: Dict[str, int]
+    # vocabulary size for each (min_count, min_word_length) threshold
+    vocabulary: Dict[Tuple[int, int], int]
+    doc_words: np.ndarray  # number of words per document
+    doc_chars: np.ndarray  # number of characters per document
+    out_of_alphabet: float  # rate of characters not in the alphabet
+    top_oov_chars: List[Tuple[str, int]]
+
+    @property
+    def ndocs(self) -> int:
+        return len(self.doc_words)
+
+    def summary(self) -> str:
+        lines = [
+            "{} documents in {} classes".format(
+                self.ndocs, len(self.class_counts)
+            )
+        ]
+        for label, count in sorted(self.class_counts.items()):
+            lines.append("  {label}: {count}".format(label=label, count=count))
+
+        lines.append("Vocabulary size (min_count, min_word_length):")
+        for (min_count, min_word_length), size in sorted(
+            self.vocabulary.items()
+        ):
+            lines.append(
+                "  ({}, {}): {}".format(min_count, min_word_length, size)
+            )
+
+        for name, values in (
+            ("words", self.doc_words),
+            ("characters", self.doc_chars),
+        ):
+            if len(values) == 0:
+                continue
+            p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+            lines.append(
+                "Document length in {name}: mean {mean:.0f}, median {p50:.0f},"
+                " p90 {p90:.0f}, p95 {p95:.0f}, p99 {p99:.0f},"
+                " max {max}".format(
+                    name=name,
+                    mean=values.mean(),
+                    p50=p50,
+                    p90=p90,
+                    p95=p95,
+                    p99=p99,
+                    max=values.max(),
+                )
+            )
+
+        lines.append(
+            "Out-of-alphabet characters: {:.2%}".format(self.out_of_alphabet)
+        )
+        if self.top_oov_chars:
+            lines.append(
+                "  most frequent: "
+                + " ".join(
+                    "{!r}({})".format(c, n) for c, n in self.top_oov_chars
+                )
+            )
+        return "\n".join(lines)
+
+    def suggested_sequence(self, quantile: float = 95) -> int:
+        """Sequence length (characters mode) covering `quantile` percent of
+        the documents"""
+        if len(self.doc_chars) == 0:
+            return -1
+        return int(np.percentile(self.doc_chars, quantile))
+
+
+def label_files(repo: Path) -> Iterator[Tuple[str, str]]:
+    """Yields (label, filename) for each file under each label directory"""
+    with os.scandir(repo) as it:
+        labels = sorted(entry.name for entry in it if entry.is_dir())
+    for label in labels:
+        for root, _, files in os.walk(os.path.join(repo, label)):
+            for f in files:
+                yield label, os.path.join(root, f)
+
+
+def head(path: str, n: int = 20) -> List[str]:
+    """Reads only the first n lines of a file"""
+    with open(path, "r", encoding="utf-8", errors="ignore") as fh:
+        return [line.rstrip("\n") for line in islice(fh, n)]
+
+
+def _profile_chunk(args):
+    files, alphabet = args
+    alphabet = set(alphabet)
+    words = Counter()  # typing: Counter[str]
+    oov = Counter()  # typing: Counter[str]
+    doc_words = []
+    doc_chars = []
+    labels = Counter()  # typing: Counter[str]
+    for label, fname in files:
+        with open(fname, "r", encoding="utf-8", errors="ignore") as fh:
+            text = fh.read().lower()
+        tokens = word_re.findall(text)
+        words.update(tokens)
+        doc_words.append(len(tokens))
+        doc_chars.append(len(text))
+        oov.update(
+            {
+                c: n
+                for c, n in Counter(text).items()
+                if c not in alphabet and not c.isspace()
+            }
+        )
+        labels[label] += 1
+    return labels, words, oov, doc_words, doc_chars
+
+
+def _stamp(repo: Path) -> Tuple:
+    # A file added or removed in a label directory changes its mtime
+    with os.scandir(repo) as it:
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in it
+                if entry.is_dir()
+            )
+        ) + (os.stat(repo).st_mtime_ns,)
+
+
+def profile_corpus(
+    repo: Path,
+    alphabet: str,
+    min_counts: Sequence[int] = (1, 5, 10, 20),
+    min_word_lengths: Sequence[int] = (1, 3, 5),
+    processes: Optional[int] = None,
+    chunksize: int = 256,
+) -> CorpusProfile:
+    """Scans a label-directory corpus with a pool of processes.
+
+    Results are cached as long as the modification times of the repository
+    and of its label directories do not change.
+    """
+    repo = Path(repo)
+    key = (
+        repo.resolve().as_posix(),
+        alphabet,
+        tuple(min_counts),
+        tuple(min_word_lengths),
+    )
+    stamp = _stamp(repo)
+    if key in _cache and _cache[key][0] == stamp:
+        return _cache[key][1]
+
+    files = list(label_files(repo))
+    chunks = [
+        (files[i : i + chunksize], alphabet)
+        for i in range(0, len(files), chunksize)
+    ]
+
+    labels = Counter()  # typing: Counter[str]
+    words = Counter()  # typing: Counter[str]
+    oov = Counter()  # typing: Counter[str]
+    doc_words = []  # typing: List[int]
+    doc_chars = []  # typing: List[int]
+
+    with Pool(processes) as pool:
+        for c_labels, c_words, c_oov, c_doc_words, c_doc_chars in (
+            pool.imap_unordered(_profile_chunk, chunks)
+        ):
+            labels.update(c_labels)
+            words.update(c_words)
+            oov.update(c_oov)
+            doc_words += c_doc_words
+            doc_chars += c_doc_chars
+
+    counts = np.fromiter(words.values(), dtype=np.int64, count=len(words))
+    lengths = np.fromiter(
+        (len(w) for w in words), dtype=np.int64, count=len(words)
+    )
+    vocabulary = {
+        (mc, mwl): int(np.count_nonzero((counts >= mc) & (lengths >= mwl)))
+        for mc in min_counts
+        for mwl in min_word_lengths
+    }
+
+    doc_chars_arr = np.array(doc_chars, dtype=np.int64)
+    total_chars = int(doc_chars_arr.sum())
+    profile = CorpusProfile(
+        class_counts=dict(labels),
+        vocabulary=vocabulary,
+        doc_words=np.array(doc_words, dtype=np.int64),
+        doc_chars=doc_chars_arr,
+        out_of_alphabet=(
+            sum(oov.values()) / total_chars if total_chars > 0 else 0.0
+        ),
+        top_oov_chars=oov.most_common(10),
+    )
+    _cache[key] = (stamp, profile)
+    return profile
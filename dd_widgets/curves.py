@@ -0,0 +1,137 @@
+import html
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from ipywidgets import HTML, Label, VBox
+
+from .metrics import MetricHistory
+
+
+def lttb(x: np.ndarray, y: np.ndarray, threshold: int) -> np.ndarray:
+    """Indices of `threshold` points keeping the shape of the curve, by
+    Largest-Triangle-Three-Buckets"""
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    # bucket limits, the first and last points being buckets of their own
+    edges = (np.linspace(1, n - 1, threshold - 1)).astype(np.int64)
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        nxt_start, nxt_end = end, edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[nxt_start:nxt_end].mean()
+        avg_y = y[nxt_start:nxt_end].mean()
+        area = np.abs(
+            (x[a] - avg_x) * (y[start:end] - y[a])
+            - (x[a] - x[start:end]) * (avg_y - y[a])
+        )
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def svg_curve(
+    x: np.ndarray,
+    y: np.ndarray,
+    title: str = "",
+    width: int = 560,
+    height: int = 150,
+) -> str:
+    """Line chart as inline SVG"""
+    margin = 50
+    x0, x1 = float(x.min()), float(x.max())
+    y0, y1 = float(y.min()), float(y.max())
+    sx = (width - margin - 10) / ((x1 - x0) or 1.0)
+    sy = (height - 30) / ((y1 - y0) or 1.0)
+    points = " ".join(
+        "{:.1f},{:.1f}".format(
+            margin + (a - x0) * sx, height - 15 - (b - y0) * sy
+        )
+        for a, b in zip(x.tolist(), y.tolist())
+    )
+    return (
+        '<svg width="{w}" height="{h}" style="font: 10px sans-serif">'
+        '<rect x="{m}" y="15" width="{pw}" height="{ph}" fill="none" '
+        'stroke="#ccc"/>'
+        '<polyline points="{points}" fill="none" stroke="#1f77b4"/>'
+        '<text x="{m}" y="10">{title}</text>'
+        '<text x="2" y="20">{y1:.4g}</text>'
+        '<text x="2" y="{yb}">{y0:.4g}</text>'
+        '<text x="{m}" y="{h}">{x0:.6g}</text>'
+        '<text x="{xr}" y="{h}" text-anchor="end">{x1:.6g}</text>'
+        "</svg>"
+    ).format(
+        w=width,
+        h=height,
+        m=margin,
+        pw=width - margin - 10,
+        ph=height - 30,
+        points=points,
+        title=html.escape(title),
+        y0=y0,
+        y1=y1,
+        yb=height - 15,
+        x0=x0,
+        x1=x1,
+        xr=width - 10,
+    )
+
+
+class LiveCurves:
+    """One chart per measure of a MetricHistory.
+
+    Charts are redrawn at most every `interval` seconds, only for the
+    measures which got new points, with at most `budget` points whatever
+    the length of the history.
+    """
+
+    def __init__(
+        self, budget: int = 500, interval: float = 2.0, x: str = "iteration"
+    ) -> None:
+        self.budget = budget
+        self.interval = interval
+        self.x = x
+        self.label = Label("No measure yet")
+        self.box = VBox([self.label])
+        self._charts = OrderedDict()  # typing: Dict[str, HTML]
+        self._counts = {}  # typing: Dict[str, int]
+        self._drawn = 0.0
+
+    def reset(self) -> None:
+        """For a new history"""
+        self._charts.clear()
+        self._counts.clear()
+        self._drawn = 0.0
+        self.label.value = "No measure yet"
+        self.box.children = [self.label]
+
+    def update(self, history: MetricHistory, force: bool = False) -> None:
+        if not force and time.monotonic() - self._drawn < self.interval:
+            return
+        self._drawn = time.monotonic()
+        xname = self.x if self.x in history else "time"
+        if len(history) == 0 or xname not in history:
+            return
+        x = history[xname]
+        self.label.value = "{} samples, x: {}".format(len(history), xname)
+        for name in history.names:
+            if name == xname:
+                continue
+            y = history[name]
+            keep = ~(np.isnan(x) | np.isnan(y))
+            count = int(keep.sum())
+            if count < 2 or self._counts.get(name) == count:
+                continue
+            self._counts[name] = count
+            xs, ys = x[keep], y[keep]
+            indices = lttb(xs, ys, self.budget)
+            if name not in self._charts:
+                self._charts[name] = HTML()
+                self.box.children = [self.label] + list(self._charts.values())
+            self._charts[name].value = svg_curve(
+                xs[indices], ys[indices], title=name
+            )
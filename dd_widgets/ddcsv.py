@@ -124,7 +124,7 @@ class CSV(MLWidget):
         return body
 
     def _train_body(self):
-        assert len(self.gpuid.index) > 0, "Set a GPU index"
+        assert len(self.gpuid.gpu_ids) > 0, "Set a GPU index"
 
         body = OrderedDict(
             [
@@ -136,9 +136,9 @@ class CSV(MLWidget):
                         "mllib": {
                             "gpu": True,
                             "gpuid": (
-                                list(self.gpuid.index)
-                                if len(self.gpuid.index) > 1
-                                else self.gpuid.index[0]
+                                list(self.gpuid.gpu_ids)
+                                if len(self.gpuid.gpu_ids) > 1
+                                else self.gpuid.gpu_ids[0]
                             ),
                             "resume": self.resume.value,
                             "solver": {
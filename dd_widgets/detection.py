@@ -3,6 +3,9 @@ from typing import List, Optional
 
 from IPython.display import display
 
+from ipywidgets import Button
+
+from .bboxstats import box_statistics
 from .core import ImageTrainerMixin, img_handle
 from .widgets import GPUIndex, Solver
 
@@ -92,3 +95,19 @@ class Detection(ImageTrainerMixin):
     ) -> None:
 
         super().__init__(sname, locals())
+
+        self.boxes_button = Button(description="Box statistics")
+        self.boxes_button.on_click(self.box_statistics)
+        self._img_explorer.children = (
+            self.boxes_button,
+        ) + self._img_explorer.children
+
+    def box_statistics(self, *_):
+        self.output.clear_output()
+        with self.output:
+            stats = box_statistics(Path(self.training_repo.value))
+            candidates = [(0, 0), (300, 300), (512, 512), (1024, 1024)]
+            if self.db_width.value > 0 or self.db_height.value > 0:
+                candidates.append((self.db_width.value, self.db_height.value))
+            print(stats.summary(candidates))
+            return stats
@@ -0,0 +1,365 @@
+import hashlib
+import json
+import logging
+import math
+import numbers
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+_schema = """
+create table if not exists runs (
+    id integer primary key,
+    sname text not null,
+    task text not null,
+    host text,
+    port integer,
+    started real not null,
+    finished real,
+    status text not null,
+    reason text,
+    body_hash text not null,
+    dataset text,
+    parameters text not null,
+    service_body text not null,
+    train_body text not null
+);
+create table if not exists params (
+    run integer not null references runs(id),
+    name text not null,
+    value real,
+    text text
+);
+create table if not exists measures (
+    run integer not null references runs(id),
+    name text not null,
+    value real not null
+);
+create table if not exists events (
+    run integer not null references runs(id),
+    time real not null,
+    status text not null,
+    message text
+);
+create index if not exists runs_sname on runs(sname, started);
+create index if not exists runs_task on runs(task, started);
+create index if not exists runs_hash on runs(body_hash);
+create index if not exists params_value on params(name, value, run);
+create index if not exists params_text on params(name, text, run);
+create index if not exists measures_value on measures(name, value, run);
+create index if not exists events_run on events(run, time);
+"""
+
+_operators = ("<", "<=", "=", "!=", ">=", ">")
+
+
+def default_path() -> Path:
+    return Path.home() / ".cache" / "dd_widgets" / "experiments.sqlite"
+
+
+def body_hash(service_body: Dict[str, Any], train_body: Dict[str, Any]) -> str:
+    """Identifies runs with the same requests, whatever the key order"""
+    text = json.dumps(
+        {"service": service_body, "train": train_body},
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+_fingerprints = {}  # typing: Dict[Tuple, Optional[str]]
+_fingerprints_lock = threading.Lock()
+
+
+def dataset_fingerprint(repo: Path, sample: int = 1 << 20) -> Optional[str]:
+    """Hash of the file names of a directory dataset, or of the size, date
+    and first and last `sample` bytes of a list file.
+
+    None for an empty or missing path. Fingerprints are kept for the
+    process by path, date and size of the file, or dates of the directory
+    and of its label directories."""
+    if str(repo) == "":
+        return None  # not the current directory
+    repo = Path(repo)
+    try:
+        key = (str(repo.resolve()),) + _stamp(repo)
+    except OSError:
+        return None
+    with _fingerprints_lock:
+        if key in _fingerprints:
+            return _fingerprints[key]
+    fingerprint = _fingerprint(repo, sample)
+    with _fingerprints_lock:
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def _stamp(repo: Path) -> Tuple:
+    st = repo.stat()
+    if not repo.is_dir():
+        return st.st_mtime_ns, st.st_size
+    # A file added or removed in a label directory changes its mtime only
+    with os.scandir(str(repo)) as it:
+        return tuple(
+            sorted(
+                (entry.name, entry.stat().st_mtime_ns)
+                for entry in it
+                if entry.is_dir()
+            )
+        ) + (st.st_mtime_ns,)
+
+
+def _fingerprint(repo: Path, sample: int) -> Optional[str]:
+    h = hashlib.sha1()
+    if repo.is_dir():
+        names = []  # typing: List[str]
+        for root, _, files in os.walk(str(repo)):
+            rel = os.path.relpath(root, str(repo))
+            names += (os.path.join(rel, f) for f in files)
+        for name in sorted(names):
+            h.update(name.encode("utf-8", errors="replace") + b"\0")
+    elif repo.is_file():
+        st = repo.stat()
+        h.update("{} {}".format(st.st_size, st.st_mtime_ns).encode())
+        with repo.open("rb") as fh:
+            h.update(fh.read(sample))
+            if st.st_size > 2 * sample:
+                fh.seek(-sample, os.SEEK_END)
+                h.update(fh.read(sample))
+    else:
+        return None
+    return h.hexdigest()
+
+
+class Run(NamedTuple):
+    id: int
+    sname: str
+    task: str
+    started: float
+    status: str
+    value: Optional[float]  # of the measure queried
+
+
+class ExperimentStore:
+    """SQLite record of the trainings: requests, parameters, dataset,
+    timeline of statuses and final measures"""
+
+    def __init__(self, path: Optional[Path] = None) -> None:
+        self.path = default_path() if path is None else Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # shared with the polling threads of the widgets
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False)
+        # several kernels may record runs at the same time
+        self._db.execute("pragma journal_mode=wal")
+        with self._lock, self._db:
+            self._db.executescript(_schema)
+
+    def start_run(
+        self,
+        sname: str,
+        task: str,
+        parameters: Dict[str, Any],
+        service_body: Dict[str, Any],
+        train_body: Dict[str, Any],
+        dataset: Optional[str] = None,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+    ) -> int:
+        now = time.time()
+        with self._lock, self._db:
+            run = self._db.execute(
+                "insert into runs (sname, task, host, port, started, status, "
+                "body_hash, dataset, parameters, service_body, train_body) "
+                "values (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    sname,
+                    task,
+                    host,
+                    port,
+                    now,
+                    "running",
+                    body_hash(service_body, train_body),
+                    dataset,
+                    json.dumps(parameters, default=str),
+                    json.dumps(service_body, default=str),
+                    json.dumps(train_body, default=str),
+                ),
+            ).lastrowid
+            self._db.executemany(
+                "insert into params (run, name, value, text) "
+                "values (?, ?, ?, ?)",
+                (
+                    (run, name) + _param_columns(value)
+                    for name, value in parameters.items()
+                ),
+            )
+            self._db.execute(
+                "insert into events (run, time, status) values (?, ?, ?)",
+                (run, now, "running"),
+            )
+        return run
+
+    def record_dataset(self, run: int, repo: Path) -> threading.Thread:
+        """Fingerprints the dataset of a run from a daemon thread, to join
+        before exiting for the fingerprint to be recorded"""
+
+        def record() -> None:
+            dataset = dataset_fingerprint(repo)
+            if dataset is None:
+                return
+            try:
+                with self._lock, self._db:
+                    self._db.execute(
+                        "update runs set dataset = ? where id = ?",
+                        (dataset, run),
+                    )
+            except sqlite3.Error as e:
+                logging.warning("Dataset of run %s not recorded: %s", run, e)
+
+        thread = threading.Thread(target=record, daemon=True)
+        thread.start()
+        return thread
+
+    def event(self, run: int, status: str, message: str = "") -> None:
+        with self._lock, self._db:
+            self._db.execute(
+                "insert into events (run, time, status, message) "
+                "values (?, ?, ?, ?)",
+                (run, time.time(), status, message),
+            )
+
+    def finish_run(
+        self,
+        run: int,
+        status: str,
+        measure: Dict[str, Any],
+        reason: Optional[str] = None,
+    ) -> None:
+        """Records the final status and measures of a run"""
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "update runs set finished = ?, status = ?, reason = ? "
+                "where id = ?",
+                (now, status, reason, run),
+            )
+            self._db.execute("delete from measures where run = ?", (run,))
+            self._db.executemany(
+                "insert into measures (run, name, value) values (?, ?, ?)",
+                (
+                    (run, name, float(value))
+                    for name, value in measure.items()
+                    if isinstance(value, numbers.Real) and math.isfinite(value)
+                ),
+            )
+            self._db.execute(
+                "insert into events (run, time, status, message) "
+                "values (?, ?, ?, ?)",
+                (run, now, status, reason or ""),
+            )
+
+    def query(
+        self,
+        measure: str,
+        task: Optional[str] = None,
+        where: Optional[Dict[str, Any]] = None,
+        maximize: bool = True,
+        limit: int = 10,
+    ) -> List[Run]:
+        """Best runs for a final measure, e.g.
+        query("map", "Detection", {"base_lr": ("<", 1e-3)}).
+
+        Conditions are on parameter values, as (operator, value) or a value
+        to be equal to."""
+        joins = ["join measures m on m.run = r.id and m.name = ?"]
+        args = [measure]  # typing: List[Any]
+        for i, (name, condition) in enumerate((where or {}).items()):
+            op, value = (
+                condition if isinstance(condition, tuple) else ("=", condition)
+            )
+            if op not in _operators:
+                raise ValueError("Unknown operator {}".format(op))
+            column = "text" if isinstance(value, str) else "value"
+            joins.append(
+                "join params p{i} on p{i}.run = r.id and p{i}.name = ? "
+                "and p{i}.{column} {op} ?".format(i=i, column=column, op=op)
+            )
+            args += [name, value if isinstance(value, str) else float(value)]
+        sql = (
+            "select r.id, r.sname, r.task, r.started, r.status, m.value "
+            "from runs r " + " ".join(joins)
+        )
+        if task is not None:
+            sql += " where r.task = ?"
+            args.append(task)
+        sql += " order by m.value {} limit ?".format(
+            "desc" if maximize else "asc"
+        )
+        args.append(limit)
+        with self._lock:
+            return [Run(*row) for row in self._db.execute(sql, args)]
+
+    def run(self, run: int) -> Dict[str, Any]:
+        """Everything recorded about a run"""
+        with self._lock:
+            cursor = self._db.execute(
+                "select * from runs where id = ?", (run,)
+            )
+            columns = [x[0] for x in cursor.description]
+            row = cursor.fetchone()
+            if row is None:
+                raise KeyError(run)
+            result = dict(zip(columns, row))
+            for key in ("parameters", "service_body", "train_body"):
+                result[key] = json.loads(result[key])
+            result["measures"] = dict(
+                self._db.execute(
+                    "select name, value from measures where run = ?", (run,)
+                )
+            )
+            result["timeline"] = self._db.execute(
+                "select time, status, message from events where run = ? "
+                "order by time",
+                (run,),
+            ).fetchall()
+        return result
+
+    def runs(self, sname: str) -> List[int]:
+        """Runs of a service, latest first"""
+        with self._lock:
+            return [
+                x[0]
+                for x in self._db.execute(
+                    "select id from runs where sname = ? "
+                    "order by started desc",
+                    (sname,),
+                )
+            ]
+
+
+def _param_columns(value: Any):
+    if isinstance(value, numbers.Real):
+        return float(value), None
+    if isinstance(value, str):
+        try:  # numbers in text widgets
+            return float(value), value
+        except ValueError:
+            return None, value
+    return None, json.dumps(value, default=str)
+
+
+_store = None  # typing: Optional[ExperimentStore]
+_store_lock = threading.Lock()
+
+
+def default_store() -> ExperimentStore:
+    """Store shared by the widgets and the headless runner"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ExperimentStore()
+    return _store
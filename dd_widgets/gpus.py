@@ -0,0 +1,368 @@
+"""GPUs of a DeepDetect host, as reported by the GPU monitor on port 12345
+(gpustat --json), and placement of trainings on the free ones."""
+
+import logging
+import threading
+import time
+import weakref
+from collections import deque
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+
+
+class GPU(NamedTuple):
+    index: int
+    utilization: float  # %
+    memory_used: float  # MiB
+    memory_total: float  # MiB
+
+    @property
+    def memory_free(self) -> float:
+        return self.memory_total - self.memory_used
+
+
+def monitor_url(host: str) -> str:
+    return "http://{}:12345".format(host)
+
+
+def gpu_status(host: str = "localhost", timeout: float = 2.0) -> List[GPU]:
+    c = requests.get(monitor_url(host), timeout=timeout)
+    c.raise_for_status()
+    return [
+        GPU(
+            int(x["index"]),
+            float(x.get("utilization.gpu") or 0),
+            float(x.get("memory.used") or 0),
+            float(x.get("memory.total") or 0),
+        )
+        for x in c.json()["gpus"]
+    ]
+
+
+class GPUInventory:
+    """Status of the GPUs of a host, shared by the widgets of the process.
+
+    Readers get the last status without waiting. A status older than `ttl`
+    seconds is probed again from a background thread, one probe at a time,
+    and given to the listeners.
+    """
+
+    def __init__(
+        self, host: str, ttl: float = 30.0, timeout: float = 1.0
+    ) -> None:
+        self.host = host
+        self.ttl = ttl
+        self.timeout = timeout
+        self.gpus = None  # typing: Optional[List[GPU]], None until known
+        self.error = None  # typing: Optional[Exception], of the last probe
+        self._probed = None  # typing: Optional[float]
+        self._probing = False
+        self._lock = threading.Lock()
+        self._listeners = []  # typing: List[Callable], weak references
+
+    def get(self) -> Optional[List[GPU]]:
+        """Last status, refreshed in the background if it is stale"""
+        with self._lock:
+            stale = not self._probing and (
+                self._probed is None
+                or time.monotonic() - self._probed > self.ttl
+            )
+            if stale:
+                self._probing = True
+        if stale:
+            threading.Thread(
+                target=self._refresh, args=(self.timeout,), daemon=True
+            ).start()
+        return self.gpus
+
+    def refresh(self, timeout: Optional[float] = None) -> Optional[List[GPU]]:
+        """Probes the monitor now, None if it does not answer"""
+        with self._lock:
+            self._probing = True
+        return self._refresh(self.timeout if timeout is None else timeout)
+
+    def _refresh(self, timeout: float) -> Optional[List[GPU]]:
+        try:
+            gpus = gpu_status(self.host, timeout)
+            error = None
+        except (requests.RequestException, ValueError, KeyError) as e:
+            gpus, error = None, e
+            logging.debug("GPU monitor of %s: %s", self.host, e)
+        with self._lock:
+            self._probed = time.monotonic()
+            self._probing = False
+            self.error = error
+            if gpus is not None:
+                self.gpus = gpus
+            listeners = [x() for x in self._listeners]
+            self._listeners = [
+                ref for ref, x in zip(self._listeners, listeners) if x
+            ]
+        if gpus is not None:
+            for listener in listeners:
+                if listener is not None:
+                    listener(gpus)
+        return gpus
+
+    def subscribe(self, listener: Callable[[List[GPU]], None]) -> None:
+        """Calls listener with each new status. Bound methods are weakly
+        referenced: a widget garbage collected stops listening"""
+        if hasattr(listener, "__self__"):
+            ref = weakref.WeakMethod(listener)  # type: ignore
+        else:
+            ref = lambda: listener  # noqa: E731
+        with self._lock:
+            self._listeners.append(ref)
+
+
+_inventories = {}  # typing: Dict[str, GPUInventory]
+_inventories_lock = threading.Lock()
+
+
+def gpu_inventory(host: str = "localhost") -> GPUInventory:
+    """Inventory of a host shared by the process"""
+    with _inventories_lock:
+        if host not in _inventories:
+            _inventories[host] = GPUInventory(host)
+        return _inventories[host]
+
+
+def gpu_parameter(job: Any):
+    """gpuid of a widget or a headless job, whose gpu_ids are the GPUs
+    used"""
+    return getattr(job, "parameters", job).gpuid
+
+
+class GPUPlacement:
+    """Queue of trainings waiting for free GPUs on a host.
+
+    A GPU is free when its utilization is at most max_utilization and it
+    has min_free_memory MiB left. Jobs, widgets or headless jobs, are
+    dispatched in order on the least loaded free GPUs, as many as their
+    gpuid holds. GPUs given to a job are reserved for `grace` seconds, until
+    the training shows in the monitor.
+    """
+
+    def __init__(
+        self,
+        host: str = "localhost",
+        max_utilization: float = 10.0,
+        min_free_memory: float = 2048.0,
+        grace: float = 120.0,
+        timeout: float = 2.0,
+    ) -> None:
+        self.host = host
+        self.max_utilization = max_utilization
+        self.min_free_memory = min_free_memory
+        self.grace = grace
+        self.timeout = timeout
+        self._reserved = {}  # typing: Dict[int, float], GPU -> reservation
+        self._pending = deque()  # typing: Deque[Tuple[Any, int]]
+        # queue and reservations, never held during requests
+        self._lock = threading.RLock()
+        self._thread = None  # typing: Optional[threading.Thread]
+
+    @property
+    def pending(self) -> List[Any]:
+        return [job for job, _ in self._pending]
+
+    def probe(self) -> Optional[List[GPU]]:
+        """Status of the GPUs, None if the monitor does not answer"""
+        inventory = gpu_inventory(self.host)
+        gpus = inventory.refresh(self.timeout)
+        if gpus is None:
+            logging.warning(
+                "GPU monitor of %s: %s", self.host, inventory.error
+            )
+        return gpus
+
+    def free(self, gpus: List[GPU]) -> List[GPU]:
+        """Free GPUs, least loaded first"""
+        now = time.monotonic()
+        for index, since in list(self._reserved.items()):
+            if now - since > self.grace:
+                del self._reserved[index]
+        return sorted(
+            (
+                x
+                for x in gpus
+                if x.index not in self._reserved
+                and x.utilization <= self.max_utilization
+                and x.memory_free >= self.min_free_memory
+            ),
+            key=lambda x: (x.utilization, x.memory_used),
+        )
+
+    def place(
+        self, count: int = 1, gpus: Optional[List[GPU]] = None
+    ) -> Optional[Tuple[int, ...]]:
+        """Reserves `count` free GPUs, None if there are not enough"""
+        if gpus is None:
+            gpus = self.probe()
+            if gpus is None:
+                return None
+        with self._lock:
+            free = self.free(gpus)
+            if len(free) < count:
+                return None
+            indices = tuple(sorted(x.index for x in free[:count]))
+            now = time.monotonic()
+            for index in indices:
+                self._reserved[index] = now
+        return indices
+
+    def release(self, indices: Tuple[int, ...]) -> None:
+        """Cancels a reservation, e.g. when the job could not start"""
+        with self._lock:
+            for index in indices:
+                self._reserved.pop(index, None)
+
+    def submit(self, job: Any, count: Optional[int] = None) -> None:
+        """Queues a job needing `count` GPUs, by default as many as its
+        gpuid holds"""
+        if count is None:
+            count = len(gpu_parameter(job).gpu_ids) or 1
+        with self._lock:
+            self._pending.append((job, count))
+
+    def step(self) -> List[Any]:
+        """Dispatches the jobs at the head of the queue which fit on the
+        free GPUs, returns them"""
+        if len(self._pending) == 0:
+            return []
+        gpus = self.probe()
+        if gpus is None:
+            return []
+        placed = []  # typing: List[Tuple[Any, Tuple[int, ...]]]
+        with self._lock:
+            while len(self._pending) > 0:
+                job, count = self._pending[0]
+                indices = self.place(count, gpus)
+                if indices is None:
+                    break  # in order: larger jobs are not starved
+                self._pending.popleft()
+                placed.append((job, indices))
+        dispatched = []  # typing: List[Any]
+        for job, indices in placed:
+            gpu_parameter(job).gpu_ids = indices
+            logging.info("Placing %s on GPU %s", job.sname, list(indices))
+            try:
+                job.run()
+            except (requests.RequestException, RuntimeError, ValueError) as e:
+                logging.error("{}: {}".format(job.sname, e))
+                self.release(indices)
+                continue
+            dispatched.append(job)
+        return dispatched
+
+    def run(self, interval: float = 10) -> None:
+        """Dispatches the queued jobs as GPUs free up, until none is left"""
+        while True:
+            self.step()
+            if len(self._pending) == 0:
+                return
+            time.sleep(interval)
+
+    def start(self, interval: float = 10) -> None:
+        """Runs the queue from a background thread, e.g. in a notebook"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self.run, args=(interval,), daemon=True
+        )
+        self._thread.start()
+
+
+class GPUTelemetry:
+    """Samples the utilization and memory of the GPUs of a job every
+    `interval` seconds, from a background thread.
+
+    summary() gives the means since the last reset, as gpu<N>_utilization
+    (%) and gpu<N>_memory (MiB) measures. A mean utilization below
+    `low_utilization` % during `window` seconds, after `warmup` seconds of
+    training, is logged once as a sign that the GPUs wait for the data.
+    """
+
+    def __init__(
+        self,
+        host: str,
+        gpuid: Tuple[int, ...],
+        interval: float = 5.0,
+        low_utilization: float = 50.0,
+        window: float = 300.0,
+        warmup: float = 300.0,
+        logger: Optional[logging.LoggerAdapter] = None,
+    ) -> None:
+        self.host = host
+        self.gpuid = tuple(gpuid)
+        self.interval = interval
+        self.low_utilization = low_utilization
+        self.window = window
+        self.warmup = warmup
+        self.logger = logger or logging.getLogger()
+        self.flagged = False  # utilization currently low
+        self._sums = {}  # typing: Dict[str, float]
+        self._count = 0
+        self._recent = deque()  # typing: Deque[Tuple[float, float]]
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._start = time.monotonic()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def summary(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                name: total / self._count for name, total in self._sums.items()
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._sums.clear()
+            self._count = 0
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def _sample_loop(self) -> None:
+        inventory = gpu_inventory(self.host)
+        while not self._stopped.wait(self.interval):
+            gpus = inventory.refresh(min(self.interval, inventory.timeout))
+            if gpus is None:
+                continue
+            mine = [x for x in gpus if x.index in self.gpuid]
+            if len(mine) == 0:
+                continue
+            with self._lock:
+                for x in mine:
+                    for name, value in (
+                        ("gpu{}_utilization".format(x.index), x.utilization),
+                        ("gpu{}_memory".format(x.index), x.memory_used),
+                    ):
+                        self._sums[name] = self._sums.get(name, 0.0) + value
+                self._count += 1
+            self._check(sum(x.utilization for x in mine) / len(mine))
+
+    def _check(self, utilization: float) -> None:
+        now = time.monotonic()
+        if now - self._start < self.warmup:
+            return
+        self._recent.append((now, utilization))
+        while now - self._recent[0][0] > self.window:
+            self._recent.popleft()
+        if now - self._recent[0][0] < self.window - 2 * self.interval:
+            return  # not yet a full window
+        mean = sum(x for _, x in self._recent) / len(self._recent)
+        if mean >= self.low_utilization:
+            self.flagged = False
+        elif not self.flagged:
+            self.flagged = True
+            self.logger.warning(
+                "GPU %s at %.0f%% utilization over %.0f s: the training "
+                "probably waits for its data, consider db, smaller images "
+                "or another batch_size",
+                ",".join(str(x) for x in self.gpuid),
+                mean,
+                self.window,
+            )
@@ -0,0 +1,405 @@
+"""Runs trainings without a notebook, from the parameters of the widgets:
+
+    python -m dd_widgets.headless jobs.yaml --wait
+
+A job file holds one job, a list of jobs, or {"defaults": {...}, "jobs":
+[...]}. Each job is the keyword arguments of the widget with its "task"
+(class name) and "sname", and optionally "stopping", a list of stopping
+rules such as {"rule": "patience", "measure": "train_loss", "patience": 5000}.
+"""
+
+import argparse
+import json
+import logging
+import sqlite3
+import sys
+import time
+from importlib import import_module
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import requests
+
+from .experiments import default_store
+from .gpus import GPUTelemetry
+from .loghandler import LazyJSON
+from .metrics import MetricRecorder, metrics_path
+from .stopping import (NonFinite, StoppingRule, check_rules, for_training,
+                       keep_best_snapshot, rule_from_config)
+from .tboard import EventWriter
+from .widgets import GPUIndex, Solver, sname_url
+
+
+class Parameter:
+    """Holds the value of a parameter where the widgets hold a widget"""
+
+    def __init__(self, value: Any) -> None:
+        self.value = value
+
+    @property
+    def index(self):  # as GPUSelect
+        return self.value
+
+    @index.setter
+    def index(self, value):
+        self.value = value
+
+    gpu_ids = index  # as GPUSelect; the value already holds GPU ids
+
+
+def parameter_value(type_hint, value):
+    """Value the widget of the parameter would hold"""
+    if type_hint in (int, float, bool):
+        return type_hint() if value is None else type_hint(value)
+    if type_hint is Solver:
+        value = value.name if isinstance(value, Solver) else str(value)
+        if value not in Solver.__members__:
+            raise ValueError("Unknown solver {}".format(value))
+        return value
+    if type_hint is GPUIndex:
+        if value is None:
+            return tuple()
+        if isinstance(value, int):
+            return (value,)
+        return tuple(value)
+    return "" if value is None else str(value)
+
+
+def task_class(task: str):
+    from . import _tasks
+
+    if task not in _tasks:
+        raise ValueError(
+            "Unknown task {}, expected one of {}".format(
+                task, ", ".join(sorted(_tasks))
+            )
+        )
+    return getattr(import_module(_tasks[task], __package__), task)
+
+
+class _Parameters:
+    def __init__(self, sname: str, parameters: Dict[str, Parameter]) -> None:
+        self.sname = sname
+        self.__dict__.update(parameters)
+
+
+class Job:
+    """Builds the service and train bodies of a widget with the same
+    methods, on plain values instead of widgets, and submits them"""
+
+    def __init__(
+        self,
+        task: str,
+        sname: str,
+        stopping: Optional[List[Any]] = None,
+        **kwargs
+    ) -> None:
+        cls = task_class(task)
+        spec = cls.parameter_spec()
+        unknown = set(kwargs) - set(name for name, _, _ in spec)
+        if len(unknown) > 0:
+            raise ValueError(
+                "Unknown parameters for {}: {}".format(
+                    task, ", ".join(sorted(unknown))
+                )
+            )
+
+        # named after the task class, whose name the builders check
+        builder = type(
+            task,
+            (_Parameters,),
+            {
+                "_create_service_body": cls._create_service_body,
+                "_train_body": cls._train_body,
+            },
+        )
+        self.task = task
+        self.sname = sname
+        self.metrics = None  # typing: Optional[MetricRecorder]
+        self.run_id = None  # typing: Optional[int], in the experiment store
+        # recording the dataset fingerprint of the run
+        self.recording = None  # typing: Optional[threading.Thread]
+        self.status = None  # typing: Optional[str], once finished
+        self.reason = None  # typing: Optional[str]
+        self.measure = {}  # typing: Dict[str, Any], last polled
+        self.parameters = builder(
+            sname,
+            {
+                name: Parameter(
+                    parameter_value(type_hint, kwargs.get(name, default))
+                )
+                for name, type_hint, default in spec
+            },
+        )
+        test_interval = getattr(self.parameters, "test_interval", None)
+        # rules or their configuration, e.g. {"rule": "patience", ...}
+        self.stopping_rules = for_training(
+            [
+                x if isinstance(x, StoppingRule) else rule_from_config(x)
+                for x in ([NonFinite()] if stopping is None else stopping)
+            ],
+            None if test_interval is None else test_interval.value,
+        )
+
+    def __getattr__(self, name: str) -> Any:
+        # parameter values, e.g. job.iterations
+        if name == "parameters":
+            raise AttributeError(name)
+        try:
+            return getattr(self.parameters, name).value
+        except AttributeError:
+            raise AttributeError(name) from None
+
+    def parameter_values(self) -> Dict[str, Any]:
+        return {
+            name: p.value
+            for name, p in vars(self.parameters).items()
+            if isinstance(p, Parameter)
+        }
+
+    def service_body(self) -> Dict[str, Any]:
+        return self.parameters._create_service_body()
+
+    def train_body(self) -> Dict[str, Any]:
+        return self.parameters._train_body()
+
+    @property
+    def service_url(self) -> str:
+        return sname_url.format(
+            host=self.host, port=self.port, path=self.path, sname=self.sname
+        )
+
+    @property
+    def train_url(self) -> str:
+        return "http://{host}:{port}/{path}/train".format(
+            host=self.host, port=self.port, path=self.path
+        )
+
+    def run(self, timeout: float = 30) -> Dict[str, Any]:
+        """Creates the service and starts the training, as the Run button"""
+        if self.metrics is not None:
+            self.metrics.close()  # of a previous run, with its telemetry
+        body = service_body = self.service_body()
+
+        c = requests.get(self.service_url, timeout=timeout)
+        if c.json()["status"]["msg"] != "NotFound":
+            logging.warning(
+                "Service '%s' was still there: %s",
+                self.sname,
+                LazyJSON(c.json()),
+            )
+
+        logging.info("Creating service '{sname}'".format(sname=self.sname))
+        c = requests.put(self.service_url, json.dumps(body), timeout=timeout)
+        if c.json()["status"]["code"] != 201:
+            raise RuntimeError(
+                "Error code {code}: {msg}".format(
+                    code=c.json()["status"]["dd_code"],
+                    msg=c.json()["status"]["dd_msg"],
+                )
+            )
+
+        body = self.train_body()
+        logging.info("Start training '{sname}'".format(sname=self.sname))
+        c = requests.post(self.train_url, json.dumps(body), timeout=timeout)
+        if c.json()["status"]["code"] != 201:
+            raise RuntimeError(
+                "Error code {code}: {msg}".format(
+                    code=c.json()["status"]["dd_code"],
+                    msg=c.json()["status"]["dd_msg"],
+                )
+            )
+        try:
+            store = default_store()
+            self.run_id = store.start_run(
+                self.sname,
+                self.task,
+                self.parameter_values(),
+                service_body,
+                body,
+                host=self.host,
+                port=self.port,
+            )
+            # jobs are submitted without waiting for the dataset walk
+            self.recording = store.record_dataset(
+                self.run_id, self.training_repo
+            )
+        except (sqlite3.Error, OSError) as e:
+            logging.warning("Run not recorded: %s", e)
+        writer = None
+        if hasattr(self.parameters, "tboard") and self.tboard != "":
+            writer = EventWriter(Path(self.tboard) / self.sname)
+        telemetry = None
+        if hasattr(self.parameters, "gpuid") and len(self.gpuid) > 0:
+            telemetry = GPUTelemetry(self.host, self.gpuid)
+        self.metrics = MetricRecorder(
+            metrics_path(self.host, self.port, self.sname, self.model_repo),
+            resume=hasattr(self.parameters, "resume") and self.resume,
+            writer=writer,
+            telemetry=telemetry,
+        )
+        return c.json()
+
+    def poll(self, info: Dict[str, Any]) -> bool:
+        """Records a train info reply and applies the stopping rules.
+        Returns whether the job is over"""
+        measure = info.get("body", {}).get("measure", {}) or {}
+        status = info.get("head", {}).get("status", "")
+        self.measure = measure
+        if self.metrics is not None:
+            self.metrics.record(info)
+        if status != "running":
+            self.finish(status or "unknown", measure)
+            return True
+        if self.metrics is None:
+            return False
+        stop = check_rules(self.stopping_rules, measure, self.metrics.history)
+        if stop is None:
+            return False
+        self.stop()
+        kept = keep_best_snapshot(self.model_repo, stop.iteration)
+        logging.warning(
+            "Stopped service %s: %s, best snapshot kept: %s",
+            self.sname,
+            stop.reason,
+            ", ".join(kept) or "none",
+        )
+        self.finish("stopped", measure, stop.reason)
+        return True
+
+    def finish(
+        self, status: str, measure: Dict[str, Any], reason: Optional[str] = None
+    ) -> None:
+        """Saves the measures and records the end of the run"""
+        self.status, self.reason = status, reason
+        if self.metrics is not None:
+            self.metrics.close()
+        if self.run_id is None:
+            return
+        try:
+            default_store().finish_run(self.run_id, status, measure, reason)
+        except sqlite3.Error as e:
+            logging.warning("Run end not recorded: %s", e)
+
+    def info(self, timeout: float = 30) -> Dict[str, Any]:
+        c = requests.get(
+            self.train_url,
+            params={"service": self.sname, "job": 1, "timeout": 10},
+            timeout=timeout,
+        )
+        return c.json()
+
+    def stop(self, timeout: float = 30) -> Dict[str, Any]:
+        if self.metrics is not None:
+            self.metrics.close()
+        c = requests.delete(self.service_url, timeout=timeout)
+        logging.info("Stop service {sname}".format(sname=self.sname))
+        return c.json()
+
+
+def wait(jobs: List[Job], interval: float = 10) -> Dict[str, Dict[str, Any]]:
+    """Polls the jobs until they are all finished, returns their last info
+    by service name"""
+    pending = list(jobs)
+    result = {}  # typing: Dict[str, Dict[str, Any]]
+    while len(pending) > 0:
+        for job in list(pending):
+            try:
+                info = job.info()
+            except (requests.RequestException, ValueError) as e:
+                logging.warning("{}: {}".format(job.sname, e))
+                continue
+            if job.poll(info):
+                status = info.get("head", {}).get("status", "")
+                if status != "running":
+                    logging.info("{}: {}".format(job.sname, status or info))
+                result[job.sname] = info
+                pending.remove(job)
+        if len(pending) > 0:
+            time.sleep(interval)
+    return result
+
+
+def _read(path: Path) -> Any:
+    text = Path(path).read_text()
+    if Path(path).suffix in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise RuntimeError("PyYAML is needed to read {}".format(path))
+        return yaml.safe_load(text)
+    return json.loads(text)
+
+
+def load_jobs(path: Path) -> List[Job]:
+    """Jobs of a JSON or YAML job file"""
+    content = _read(path)
+    defaults = {}  # typing: Dict[str, Any]
+    if isinstance(content, dict) and "jobs" in content:
+        defaults = content.get("defaults", {})
+        content = content["jobs"]
+    if isinstance(content, dict):
+        content = [content]
+    return [Job(**dict(defaults, **kwargs)) for kwargs in content]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m dd_widgets.headless",
+        description="Submit trainings described by JSON or YAML job files",
+    )
+    parser.add_argument("files", nargs="+", type=Path)
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="print the service and train bodies instead of submitting",
+    )
+    parser.add_argument(
+        "--wait", action="store_true", help="wait for the trainings to end"
+    )
+    parser.add_argument("--interval", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(
+        format="%(asctime)s - %(levelname)s - %(message)s",
+        level=logging.INFO,
+    )
+
+    jobs = [job for path in args.files for job in load_jobs(path)]
+
+    if args.dry_run:
+        for job in jobs:
+            print(
+                json.dumps(
+                    {
+                        "sname": job.sname,
+                        "service": job.service_body(),
+                        "train": job.train_body(),
+                    },
+                    indent=2,
+                )
+            )
+        return 0
+
+    submitted = []  # typing: List[Job]
+    failed = 0
+    for job in jobs:
+        try:
+            reply = job.run()
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            logging.error("{}: {}".format(job.sname, e))
+            failed += 1
+            continue
+        logging.info("%s: %s", job.sname, LazyJSON(reply))
+        submitted.append(job)
+
+    if args.wait:
+        wait(submitted, args.interval)
+    for job in submitted:
+        if job.recording is not None:
+            job.recording.join()  # daemon threads, cut short at exit
+    return 1 if failed > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
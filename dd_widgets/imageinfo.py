@@ -0,0 +1,122 @@
+import struct
+from pathlib import Path
+from typing import Optional, Tuple
+
+import cv2
+
+# JPEG start-of-frame markers carrying the image size
+_sof_markers = set(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+
+def _exif_orientation(app1: bytes) -> int:
+    """Orientation tag of an Exif APP1 payload, 1 (upright) when absent"""
+    if not app1.startswith(b"Exif\0\0") or len(app1) < 16:
+        return 1
+    tiff = app1[6:]
+    order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if order is None:
+        return 1
+    ifd = struct.unpack(order + "I", tiff[4:8])[0]
+    if ifd + 2 > len(tiff):
+        return 1
+    count = struct.unpack(order + "H", tiff[ifd : ifd + 2])[0]
+    for k in range(ifd + 2, min(ifd + 2 + 12 * count, len(tiff) - 11), 12):
+        tag, _, _, value = struct.unpack(order + "HHIH", tiff[k : k + 10])
+        if tag == 0x0112:
+            return value
+    return 1
+
+
+def _jpeg_size(fh) -> Optional[Tuple[int, int]]:
+    fh.seek(2)
+    orientation = 1
+    while True:
+        byte = fh.read(1)
+        while byte and byte != b"\xff":
+            byte = fh.read(1)
+        while byte == b"\xff":
+            byte = fh.read(1)
+        if not byte:
+            return None
+        marker = byte[0]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            continue  # markers without payload
+        length = struct.unpack(">H", fh.read(2))[0]
+        if marker == 0xE1:  # APP1, whose Exif comes before the frame
+            orientation = _exif_orientation(fh.read(length - 2))
+            continue
+        if marker in _sof_markers:
+            height, width = struct.unpack(">xHH", fh.read(5))
+            if 5 <= orientation <= 8:
+                return height, width  # turned by 90 degrees by cv2.imread
+            return width, height
+        fh.seek(length - 2, 1)
+
+
+def header_size(path: Path) -> Optional[Tuple[int, int]]:
+    """(width, height) read from the header of PNG, JPEG, GIF and BMP files,
+    None for other formats. JPEG sizes follow the Exif orientation, applied
+    by cv2.imread"""
+    with open(str(path), "rb") as fh:
+        head = fh.read(26)
+        if head.startswith(b"\x89PNG\r\n\x1a\n") and head[12:16] == b"IHDR":
+            return struct.unpack(">II", head[16:24])
+        if head.startswith(b"\xff\xd8"):
+            return _jpeg_size(fh)
+        if head[:6] in (b"GIF87a", b"GIF89a"):
+            return struct.unpack("<HH", head[6:10])
+        if head.startswith(b"BM"):
+            width, height = struct.unpack("<ii", head[18:26])
+            return width, abs(height)
+    return None
+
+
+def image_size(path: Path) -> Optional[Tuple[int, int]]:
+    """(width, height) of an image, from its header when possible, or by
+    decoding it. None if the file cannot be read"""
+    try:
+        size = header_size(path)
+    except (OSError, struct.error):
+        return None
+    if size is not None:
+        return size
+    # any flag but IMREAD_UNCHANGED applies the orientation
+    data = cv2.imread(str(path), cv2.IMREAD_ANYCOLOR | cv2.IMREAD_ANYDEPTH)
+    if data is None:
+        return None
+    return data.shape[1], data.shape[0]
+
+
+def oriented(
+    size: Tuple[int, int], shape: Tuple[int, ...]
+) -> Tuple[int, int]:
+    """Full resolution size (width, height), turned by 90 degrees when the
+    decoded image of `shape` (rows, columns, ...) is"""
+    width, height = size
+    rows, columns = shape[:2]
+    if (width - height) * (columns - rows) < 0:
+        return height, width
+    return width, height
+
+
+_reduced_flags = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8, cv2.IMREAD_REDUCED_GRAYSCALE_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4, cv2.IMREAD_REDUCED_GRAYSCALE_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2, cv2.IMREAD_REDUCED_GRAYSCALE_2),
+)
+
+
+def reduced_flag(
+    width: int,
+    height: int,
+    min_width: float,
+    min_height: float,
+    grayscale: bool = False,
+) -> int:
+    """imread flag decoding at the lowest resolution (1/2, 1/4 or 1/8, which
+    JPEG decodes without computing the full image) that stays larger than
+    min_width x min_height"""
+    for factor, color, gray in _reduced_flags:
+        if width // factor >= min_width and height // factor >= min_height:
+            return gray if grayscale else color
+    return cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
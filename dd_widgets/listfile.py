@@ -0,0 +1,193 @@
+import os
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+image_extensions = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+
+# annotation file extensions, and whether the content of the annotation goes
+# in the list file (OCR, Regression) instead of its path
+task_annotations = {
+    "Detection": ((".txt",), False),
+    "Segmentation": ((".png",), False),
+    "OCR": ((".txt",), True),
+    "Regression": ((".txt",), True),
+}
+
+
+# (path, size, readable, text), text of annotations written inline only
+Entry = Tuple[str, int, bool, Optional[str]]
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path, "r", encoding="utf-8") as fh:
+            return " ".join(fh.read().split())
+    except (OSError, UnicodeDecodeError):
+        return None
+
+
+def _scan(
+    path: str, extensions: Tuple[str, ...], read: bool
+) -> Tuple[List[Entry], List[Tuple[str, Tuple[int, int]]]]:
+    files = []  # typing: List[Entry]
+    dirs = []  # typing: List[Tuple[str, Tuple[int, int]]]
+    with os.scandir(path) as it:
+        for entry in it:
+            if entry.is_dir(follow_symlinks=True):
+                st = entry.stat(follow_symlinks=True)
+                dirs.append((entry.path, (st.st_dev, st.st_ino)))
+            elif entry.is_file(follow_symlinks=True):
+                if os.path.splitext(entry.name)[1].lower() not in extensions:
+                    continue
+                size = entry.stat().st_size
+                readable = os.access(entry.path, os.R_OK)
+                text = None
+                if read and readable and size > 0:
+                    text = _read(entry.path)
+                    readable = text is not None
+                files.append((entry.path, size, readable, text))
+    return files, dirs
+
+
+def scan_tree(
+    root: Path,
+    extensions: Iterable[str],
+    workers: int = 16,
+    read: bool = False,
+) -> Tuple[Dict[str, Entry], List[str]]:
+    """Files of a directory tree with one of the extensions, indexed by their
+    path relative to root without extension, as (path, size, readable,
+    text), where text is the content of the file if `read`. Also returns
+    the files left out because another one has the same path without
+    extension, e.g. a.png next to a.jpg.
+
+    Each directory is listed with os.scandir, and the files read, as a
+    separate task of a thread pool, so that deep and wide trees are both
+    walked in parallel. Directories reached again through symlinks are
+    walked once.
+    """
+    root = os.path.abspath(str(root))
+    extensions = tuple(e.lower() for e in extensions)
+    result = {}  # typing: Dict[str, Entry]
+    collisions = []  # typing: List[str]
+    st = os.stat(root)
+    visited = {(st.st_dev, st.st_ino)}
+    with ThreadPoolExecutor(workers) as executor:
+        pending = {executor.submit(_scan, root, extensions, read)}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                files, dirs = future.result()
+                for d, key in dirs:
+                    if key not in visited:
+                        visited.add(key)
+                        pending.add(
+                            executor.submit(_scan, d, extensions, read)
+                        )
+                for entry in files:
+                    stem = os.path.splitext(entry[0])[0]
+                    key = os.path.relpath(stem, root)
+                    if key in result:
+                        # the same in any walk order
+                        kept = min(result[key], entry)
+                        collisions.append(max(result[key], entry)[0])
+                        entry = kept
+                    result[key] = entry
+    return result, sorted(collisions)
+
+
+def is_test(key: str, test_ratio: float, seed: str = "") -> bool:
+    """Deterministic split: depends only on the key, not on the walk order"""
+    h = zlib.crc32((seed + key).encode("utf-8")) & 0xFFFFFFFF
+    return h < test_ratio * 2 ** 32
+
+
+class ListFileReport(NamedTuple):
+    train: int
+    test: int
+    orphan_images: List[str]
+    orphan_annotations: List[str]
+    unreadable: List[str]  # unreadable or empty files
+    collisions: List[str]  # left out, same name as another but extension
+
+    def summary(self) -> str:
+        return (
+            "{train} training and {test} testing pairs, "
+            "{oi} images without annotation, "
+            "{oa} annotations without image, "
+            "{u} unreadable or empty files, "
+            "{c} files with the name of another"
+        ).format(
+            train=self.train,
+            test=self.test,
+            oi=len(self.orphan_images),
+            oa=len(self.orphan_annotations),
+            u=len(self.unreadable),
+            c=len(self.collisions),
+        )
+
+
+def build_list_files(
+    image_dir: Path,
+    annotation_dir: Path,
+    train_file: Path,
+    test_file: Optional[Path] = None,
+    task: str = "Detection",
+    test_ratio: float = 0.1,
+    seed: str = "",
+    workers: int = 16,
+) -> ListFileReport:
+    """Writes the list files (image and annotation per line) expected by the
+    Detection, Segmentation, OCR and Regression widgets.
+
+    Images and annotations are paired by their path relative to image_dir
+    and annotation_dir without extension. For OCR and Regression, the
+    annotation files hold the label, which is written inline.
+    """
+    extensions, inline = task_annotations[task]
+    images, collisions = scan_tree(Path(image_dir), image_extensions, workers)
+    annotations, more = scan_tree(
+        Path(annotation_dir), extensions, workers, read=inline
+    )
+    collisions = sorted(collisions + more)
+
+    unreadable = sorted(
+        path
+        for path, size, readable, _ in list(images.values())
+        + list(annotations.values())
+        if size == 0 or not readable
+    )
+    bad = set(unreadable)
+
+    train = []  # typing: List[str]
+    test = []  # typing: List[str]
+    for key in sorted(images.keys() & annotations.keys()):
+        image, annotation = images[key][0], annotations[key][0]
+        if image in bad or annotation in bad:
+            continue
+        if inline:
+            annotation = annotations[key][3]
+        line = "{} {}\n".format(image, annotation)
+        if test_file is not None and is_test(key, test_ratio, seed):
+            test.append(line)
+        else:
+            train.append(line)
+
+    Path(train_file).write_text("".join(train))
+    if test_file is not None:
+        Path(test_file).write_text("".join(test))
+
+    return ListFileReport(
+        train=len(train),
+        test=len(test),
+        orphan_images=sorted(
+            images[k][0] for k in images.keys() - annotations.keys()
+        ),
+        orphan_annotations=sorted(
+            annotations[k][0] for k in annotations.keys() - images.keys()
+        ),
+        unreadable=unreadable,
+        collisions=collisions,
+    )
@@ -1,28 +1,298 @@
+import json
 import logging
+import logging.handlers
+import os
+import re
+import sys
+import threading
+import time
+import traceback
+from collections import deque
 
 import ipywidgets
 
 
 class OutputWidgetHandler(logging.Handler):
-    """ Custom logging handler sending logs to an output widget """
+    """ Custom logging handler sending logs to an output widget
 
-    def __init__(self, *args, **kwargs):
+    Records go to a ring buffer of the last `lines` lines, which a background
+    thread writes to the widget at most `rate` times per second.
+    """
+
+    def __init__(self, *args, lines=200, rate=4.0, **kwargs):
         super(OutputWidgetHandler, self).__init__(*args, **kwargs)
-        layout = {"width": "590px", "height": "800px", "border": "none"}
-        self.out = ipywidgets.Output(layout=layout)
+        self._out = None
+        self.buffer = deque(maxlen=lines)
+        self.interval = 1.0 / rate
+        self._dirty = threading.Event()
+        self._thread = None
+
+    @property
+    def out(self):
+        # created on first use: importing the package must not create widgets
+        if self._out is None:
+            layout = {"width": "590px", "height": "800px", "border": "none"}
+            self._out = ipywidgets.Output(layout=layout)
+        return self._out
 
     def emit(self, record):
         """ Overload of logging.Handler method """
-        formatted_record = self.format(record)
-        new_output = {
-            "name": "stdout",
-            "output_type": "stream",
-            "text": formatted_record + "\n",
+        try:
+            self.buffer.append(self.format(record) + "\n")
+        except Exception:
+            self.handleError(record)
+            return
+        self._dirty.set()
+        if self._thread is None:
+            with self.lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._flush_loop, daemon=True
+                    )
+                    self._thread.start()
+
+    def _flush_loop(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                self.flush()
+            except Exception:
+                # e.g. a closed widget: not logged, which would loop back
+                # here, and the next records are still flushed
+                traceback.print_exc(file=sys.stderr)
+            time.sleep(self.interval)
+
+    def flush(self):
+        if self._out is None and len(self.buffer) == 0:
+            return
+        # a single stream output: one message to the front-end per flush
+        self.out.outputs = (
+            {
+                "name": "stdout",
+                "output_type": "stream",
+                "text": "".join(list(self.buffer)),
+            },
+        )
+
+    def clear(self):
+        self.buffer.clear()
+        self.out.clear_output()
+
+
+class LazyJSON:
+    """ Log argument serialized as compact JSON, and only if the record is
+    formatted, i.e. if its level is enabled. Longer texts are cut at
+    max_chars """
+
+    __slots__ = ("payload", "max_chars")
+
+    def __init__(self, payload, max_chars=4096):
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self):
+        text = json.dumps(self.payload, separators=(",", ":"), default=str)
+        if len(text) > self.max_chars:
+            return text[: self.max_chars] + "... ({} chars)".format(len(text))
+        return text
+
+
+class JSONLinesFormatter(logging.Formatter):
+    """ One compact JSON object per record """
+
+    def format(self, record):
+        entry = {
+            "time": round(record.created, 3),
+            "level": record.levelname,
+            "service": getattr(record, "service", None),
+            "where": "{}:{}".format(record.filename, record.lineno),
+            "message": record.getMessage(),
         }
-        self.out.outputs = (new_output,)  # + self.out.outputs
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, separators=(",", ":"))
+
+
+def render_record(line):
+    """ Text of a JSON lines record, as in the INFO tab """
+    try:
+        entry = json.loads(line)
+        return "{} - {} - {{{}}} {}\n".format(
+            time.strftime("%m-%d %H:%M:%S", time.localtime(entry["time"])),
+            entry["level"],
+            entry["where"],
+            entry["message"],
+        ) + entry.get("exception", "")
+    except (ValueError, KeyError, TypeError):
+        return line if line.endswith("\n") else line + "\n"
+
+
+def record_filter(level=logging.DEBUG, service=None):
+    """ Predicate on JSON lines records: at least `level`, and from
+    `service` unless None """
+
+    def keep(line):
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            return level <= logging.DEBUG and service is None
+        return logging.getLevelName(entry.get("level")) >= level and (
+            service is None or entry.get("service") == service
+        )
+
+    return keep
+
+
+class LogTail:
+    """ Last lines of a growing log file.
 
-        # workaround for Jupyter Lab
-        # https://github.com/jupyter-widgets/ipywidgets/issues/1810
+    The first read seeks backwards from the end, block by block, until
+    enough lines are kept; the next ones only read the bytes appended since.
+    A rotated file is read again from its end. At most max_bytes are read
+    per call, whatever the size of the file.
+    """
+
+    def __init__(
+        self, path, lines=200, keep=None, block_size=1 << 16, max_bytes=1 << 23
+    ):
+        self.path = path
+        self.lines = deque(maxlen=lines)
+        self.keep = keep  # typing: Optional[Callable[[str], bool]]
+        self.block_size = block_size
+        self.max_bytes = max_bytes
+        self._offset = None  # typing: Optional[int]
+        self._inode = None
+        self._lock = threading.Lock()
+
+    def _decode(self, parts):
+        lines = (x.decode("utf-8", errors="replace") for x in parts)
+        if self.keep is None:
+            return list(lines)
+        return [x for x in lines if self.keep(x)]
+
+    def _last_newline(self, fh, size):
+        """ Offset following the last complete line """
+        pos = size
+        while pos > 0 and size - pos < self.max_bytes:
+            length = min(self.block_size, pos)
+            pos -= length
+            fh.seek(pos)
+            index = fh.read(length).rfind(b"\n")
+            if index >= 0:
+                return pos + index + 1
+        return 0
+
+    def _read_backwards(self, fh, end):
+        blocks = []  # typing: List[List[str]], last lines first
+        count = 0
+        pos = end
+        carry = None  # start of the line ending in the block read before
+        while pos > 0 and end - pos < self.max_bytes:
+            length = min(self.block_size, pos)
+            pos -= length
+            fh.seek(pos)
+            data = fh.read(length)
+            data = data[:-1] if carry is None else data + carry
+            parts = data.split(b"\n")
+            carry = parts.pop(0) if pos > 0 else b""
+            lines = self._decode(parts)
+            blocks.append(lines)
+            count += len(lines)
+            if count >= self.lines.maxlen:
+                break
+        lines = [x for lines in reversed(blocks) for x in lines]
+        return lines[-self.lines.maxlen :]
+
+    def read(self):
+        """ Lines added since the last call, all the kept lines the first
+        time """
+        with self._lock:
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return []
+            with open(self.path, "rb") as fh:
+                if (
+                    self._offset is None
+                    or st.st_ino != self._inode
+                    or st.st_size < self._offset
+                    or st.st_size - self._offset > self.max_bytes
+                ):
+                    self.lines.clear()
+                    self._inode = st.st_ino
+                    end = self._last_newline(fh, st.st_size)
+                    new = self._read_backwards(fh, end)
+                else:
+                    fh.seek(self._offset)
+                    data = fh.read(st.st_size - self._offset)
+                    index = data.rfind(b"\n")
+                    if index < 0:
+                        return []
+                    end = self._offset + index + 1
+                    new = self._decode(data[:index].split(b"\n"))
+                self._offset = end
+            self.lines.extend(new)
+            return new
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """ Queue handler leaving the formatting to the listener thread """
+
+    def prepare(self, record):
+        # the queue stays in the process: payloads need not be serialized
+        return record
+
+
+class LazyFileHandler(logging.handlers.RotatingFileHandler):
+    """ Rotating file handler creating its directory and file on the first
+    record """
+
+    def __init__(self, filename, max_bytes=10 << 20, backup_count=3):
+        super(LazyFileHandler, self).__init__(
+            filename, maxBytes=max_bytes, backupCount=backup_count, delay=True
+        )
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.baseFilename), exist_ok=True)
+        return super(LazyFileHandler, self)._open()
+
+
+def service_logfile(logfile_name, service=None):
+    """ Log file of the records of a service, next to logfile_name """
+    if service is None:
+        return logfile_name
+    stem, ext = os.path.splitext(logfile_name)
+    return "{}.{}{}".format(stem, re.sub(r"[^\w.-]", "_", service), ext)
+
+
+class ServiceFileHandler(logging.Handler):
+    """ JSON lines files with a size cap, rotated separately for each
+    service: records with a `service` attribute go to their service file """
+
+    def __init__(self, filename, max_bytes=10 << 20, backup_count=3):
+        super(ServiceFileHandler, self).__init__()
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.setFormatter(JSONLinesFormatter())
+        self._handlers = {}  # typing: Dict[Optional[str], LazyFileHandler]
+
+    def _handler(self, service):
+        if service not in self._handlers:
+            handler = LazyFileHandler(
+                service_logfile(self.filename, service),
+                self.max_bytes,
+                self.backup_count,
+            )
+            handler.setFormatter(self.formatter)
+            self._handlers[service] = handler
+        return self._handlers[service]
+
+    def emit(self, record):
+        self._handler(getattr(record, "service", None)).emit(record)
 
-        with self.out:
-            print(formatted_record)
+    def close(self):
+        for handler in self._handlers.values():
+            handler.close()
+        super(ServiceFileHandler, self).close()
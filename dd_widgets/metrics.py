@@ -0,0 +1,205 @@
+import numbers
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+from .cache import cache_path
+from .gpus import GPUTelemetry
+from .tboard import EventWriter
+
+
+def metrics_path(host: str, port: int, sname: str, model_repo: str) -> Path:
+    """File of the metric history of a service"""
+    return cache_path("metrics", host, str(port), sname, str(model_repo))
+
+
+def numeric(measure: Dict[str, Any]) -> Dict[str, float]:
+    """Numeric values of a measure"""
+    return {
+        name: float(value)
+        for name, value in measure.items()
+        if isinstance(value, numbers.Real) and not isinstance(value, bool)
+    }
+
+
+class MetricHistory:
+    """Time series of the measures of a training job.
+
+    Each numeric measure is a float32 column, grown by `chunk` rows; a
+    measure appearing later is NaN before. Times are seconds since `start`.
+    Polls which repeat the iteration of the previous sample are skipped.
+    """
+
+    def __init__(self, chunk: int = 1024, start: Optional[float] = None):
+        self.chunk = chunk
+        self.start = time.time() if start is None else start
+        self.size = 0
+        self._columns = {}  # typing: Dict[str, np.ndarray]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._columns
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        return self._columns[name][: self.size]
+
+    @property
+    def names(self) -> List[str]:
+        return [x for x in self._columns if x != "time"]
+
+    def _column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            self._columns[name] = np.full(
+                self._capacity(), np.nan, dtype=np.float32
+            )
+        return self._columns[name]
+
+    def _capacity(self) -> int:
+        for column in self._columns.values():
+            return len(column)
+        return self.chunk
+
+    def _grow(self) -> None:
+        capacity = self._capacity() + self.chunk
+        for name, column in self._columns.items():
+            grown = np.full(capacity, np.nan, dtype=np.float32)
+            grown[: self.size] = column[: self.size]
+            self._columns[name] = grown
+
+    def append(
+        self, measure: Dict[str, Any], timestamp: Optional[float] = None
+    ) -> bool:
+        """Adds the numeric values of a measure, returns whether it was new"""
+        values = numeric(measure)
+        if len(values) == 0:
+            return False
+        if (
+            self.size > 0
+            and "iteration" in values
+            and "iteration" in self._columns
+            and self["iteration"][-1] == np.float32(values["iteration"])
+        ):
+            return False
+
+        if self.size == self._capacity():
+            self._grow()
+        timestamp = time.time() if timestamp is None else timestamp
+        values["time"] = timestamp - self.start
+        for name, value in values.items():
+            self._column(name)[self.size] = value
+        self.size += 1
+        return True
+
+    def save(self, path: Path) -> None:
+        """Writes the history to a npz file, replaced atomically"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        with open(str(tmp), "wb") as fh:
+            np.savez(
+                fh,
+                start=np.float64(self.start),
+                **{name: self[name] for name in self._columns}
+            )
+        os.replace(str(tmp), str(path))
+
+    @classmethod
+    def load(cls, path: Path, chunk: int = 1024) -> "MetricHistory":
+        with np.load(str(path)) as data:
+            history = cls(chunk, float(data["start"]))
+            columns = {x: data[x] for x in data.files if x != "start"}
+        for name, values in columns.items():
+            history.size = len(values)
+            capacity = -(-max(1, len(values)) // chunk) * chunk
+            column = np.full(capacity, np.nan, dtype=np.float32)
+            column[: len(values)] = values
+            history._columns[name] = column
+        return history
+
+
+class MetricRecorder:
+    """Appends the polled measures of a job to a MetricHistory, and spills it
+    to `path` every `every` seconds. New samples also go to the TensorBoard
+    writer, if any.
+
+    Samples get iterations_per_s, and the GPU measures of the telemetry, if
+    any, averaged since the previous sample."""
+
+    def __init__(
+        self,
+        path: Path,
+        every: float = 60.0,
+        resume: bool = True,
+        writer: Optional[EventWriter] = None,
+        telemetry: Optional[GPUTelemetry] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.every = every
+        self.writer = writer
+        self.telemetry = telemetry
+        self.closed = False
+        self.history = MetricHistory()
+        if resume and self.path.exists():
+            try:
+                self.history = MetricHistory.load(self.path)
+            except (OSError, ValueError, KeyError):
+                pass  # unreadable file: start again
+        self._saved = time.monotonic()
+
+    def record(self, info: Dict[str, Any]) -> bool:
+        """Records the measure of a train info reply, returns whether it was
+        new"""
+        measure = info.get("body", {}).get("measure", {}) or {}
+        now = time.time()
+        measure = dict(measure, **self._rate(measure, now))
+        if self.telemetry is not None:
+            measure.update(self.telemetry.summary())
+        new = self.history.append(measure, now)
+        if new and self.telemetry is not None:
+            self.telemetry.reset()
+        if new and self.writer is not None:
+            values = numeric(measure)
+            step = values.pop("iteration", len(self.history))
+            self.writer.add_scalars(int(step), values)
+        if new and time.monotonic() - self._saved > self.every:
+            self.save()
+        return new
+
+    def _rate(self, measure: Dict[str, Any], now: float) -> Dict[str, float]:
+        history = self.history
+        iteration = measure.get("iteration")
+        if (
+            not isinstance(iteration, numbers.Real)
+            or len(history) == 0
+            or "iteration" not in history
+        ):
+            return {}
+        elapsed = now - history.start - float(history["time"][-1])
+        done = float(iteration) - float(history["iteration"][-1])
+        if elapsed <= 0 or not done > 0:
+            return {}
+        return {"iterations_per_s": done / elapsed}
+
+    def save(self) -> None:
+        self.history.save(self.path)
+        self._saved = time.monotonic()
+
+    def close(self) -> None:
+        """At the end of the job, stops the telemetry. Closing again does
+        nothing"""
+        if self.closed:
+            return
+        self.closed = True
+        if self.telemetry is not None:
+            self.telemetry.stop()
+            self.telemetry = None
+        if len(self.history) > 0:
+            self.save()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
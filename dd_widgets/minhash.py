@@ -0,0 +1,201 @@
+import re
+import zlib
+from collections import defaultdict
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterable, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from .corpus import label_files
+
+word_re = re.compile(r"\w+")
+
+# (a * x + b) stays below 2**64 for x, a, b < 2**32
+prime = np.uint64(4294967311)
+
+
+def _permutations(num_perm: int, seed: int) -> Tuple[np.ndarray, np.ndarray]:
+    rng = np.random.RandomState(seed)
+    a = rng.randint(1, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    b = rng.randint(0, 2 ** 32 - 1, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def shingles(text: str, k: int) -> np.ndarray:
+    """32-bit hashes of the word k-grams of a document"""
+    words = word_re.findall(text.lower())
+    if len(words) < k:
+        grams = [" ".join(words)]
+    else:
+        grams = (" ".join(words[i : i + k]) for i in range(len(words) - k + 1))
+    return np.unique(
+        np.fromiter(
+            (zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64
+        )
+    )
+
+
+def _signature_chunk(args):
+    files, k, num_perm, seed = args
+    a, b = _permutations(num_perm, seed)
+    signatures = np.empty((len(files), num_perm), dtype=np.uint64)
+    for i, fname in enumerate(files):
+        with open(fname, "r", encoding="utf-8", errors="ignore") as fh:
+            x = shingles(fh.read(), k)
+        signatures[i] = ((x[:, None] * a + b) % prime).min(axis=0)
+    return signatures
+
+
+def signatures(
+    files: List[str],
+    k: int = 5,
+    num_perm: int = 128,
+    seed: int = 1,
+    processes: Optional[int] = None,
+    chunksize: int = 256,
+) -> np.ndarray:
+    """MinHash signatures (one row per file) computed in a process pool"""
+    chunks = [
+        (files[i : i + chunksize], k, num_perm, seed)
+        for i in range(0, len(files), chunksize)
+    ]
+    if len(chunks) == 0:
+        return np.empty((0, num_perm), dtype=np.uint64)
+    with Pool(processes) as pool:
+        return np.concatenate(pool.map(_signature_chunk, chunks))
+
+
+def candidate_pairs(sig: np.ndarray, bands: int, split: int) -> np.ndarray:
+    """Locality-sensitive hashing: files sharing any band of their
+    signatures become candidate pairs.
+
+    Each bucket member is paired with the first member of the bucket and with
+    the first member on each side of `split`, so that exact duplicates do not
+    produce a quadratic number of pairs.
+    """
+    rows = sig.shape[1] // bands
+    pairs = set()  # typing: Set[Tuple[int, int]]
+    for band in range(bands):
+        buckets = defaultdict(list)  # typing: Dict[bytes, List[int]]
+        chunk = np.ascontiguousarray(sig[:, band * rows : (band + 1) * rows])
+        for i, row in enumerate(chunk):
+            buckets[row.tobytes()].append(i)
+        for bucket in buckets.values():
+            if len(bucket) < 2:
+                continue
+            heads = {bucket[0]}
+            heads.update(next(([i] for i in bucket if i < split), []))
+            heads.update(next(([i] for i in bucket if i >= split), []))
+            for head in heads:
+                pairs.update((head, i) for i in bucket if i > head)
+    return np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+
+
+def _find(parent: List[int], i: int) -> int:
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def clusters(n: int, pairs: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    """Connected components (with more than one element) of the graph on
+    range(n) given by its edges, largest first"""
+    parent = list(range(n))
+    for i, j in pairs:
+        parent[_find(parent, j)] = _find(parent, i)
+    groups = defaultdict(list)  # typing: Dict[int, List[int]]
+    for i in range(n):
+        groups[_find(parent, i)].append(i)
+    return sorted(
+        (g for g in groups.values() if len(g) > 1), key=len, reverse=True
+    )
+
+
+class DuplicateReport(NamedTuple):
+    train_files: List[str]
+    test_files: List[str]
+    # groups of near-duplicate files within the training set
+    clusters: List[List[str]]
+    # (test file, train file, estimated Jaccard similarity)
+    leakage: List[Tuple[str, str, float]]
+
+    def summary(self) -> str:
+        redundant = sum(len(c) - 1 for c in self.clusters)
+        leaking = len(set(test for test, _, _ in self.leakage))
+        lines = [
+            "{} near-duplicate clusters in {} training files "
+            "({} redundant files)".format(
+                len(self.clusters), len(self.train_files), redundant
+            ),
+            "{} of {} testing files also appear in the training set".format(
+                leaking, len(self.test_files)
+            ),
+        ]
+        for cluster in self.clusters[:10]:
+            lines.append("  " + " ".join(cluster))
+        return "\n".join(lines)
+
+    def deduplicated(self) -> Tuple[List[str], List[str]]:
+        """Training files with one file per cluster, and testing files
+        without any near-duplicate in the training set"""
+        drop_train = set(f for c in self.clusters for f in c[1:])
+        drop_test = set(test for test, _, _ in self.leakage)
+        return (
+            [f for f in self.train_files if f not in drop_train],
+            [f for f in self.test_files if f not in drop_test],
+        )
+
+    def write_lists(self, dirname: Path) -> Tuple[Path, Path]:
+        """Writes train.txt and test.txt with the deduplicated file lists"""
+        dirname = Path(dirname)
+        dirname.mkdir(parents=True, exist_ok=True)
+        train, test = self.deduplicated()
+        paths = dirname / "train.txt", dirname / "test.txt"
+        for path, files in zip(paths, (train, test)):
+            path.write_text("".join(f + "\n" for f in files))
+        return paths
+
+
+def near_duplicates(
+    training_repo: Path,
+    testing_repo: Optional[Path] = None,
+    threshold: float = 0.8,
+    k: int = 5,
+    num_perm: int = 128,
+    bands: int = 16,
+    processes: Optional[int] = None,
+) -> DuplicateReport:
+    """Near-duplicate documents within `training_repo` and between
+    `training_repo` and `testing_repo` (label directory layouts)"""
+    train_files = [f for _, f in label_files(Path(training_repo))]
+    test_files = (
+        [f for _, f in label_files(Path(testing_repo))]
+        if testing_repo
+        else []
+    )
+    files = train_files + test_files
+    ntrain = len(train_files)
+
+    sig = signatures(files, k, num_perm, processes=processes)
+
+    duplicates = []  # typing: List[Tuple[int, int]]
+    leakage = []  # typing: List[Tuple[str, str, float]]
+    pairs = candidate_pairs(sig, bands, ntrain)
+    similarity = (sig[pairs[:, 0]] == sig[pairs[:, 1]]).mean(axis=1)
+    for (i, j), s in zip(pairs, similarity):
+        if s < threshold:
+            continue
+        # i < j, hence j is the testing file when the pair is across sets
+        if j < ntrain:
+            duplicates.append((i, j))
+        elif i < ntrain:
+            leakage.append((files[j], files[i], float(s)))
+
+    return DuplicateReport(
+        train_files,
+        test_files,
+        [sorted(files[i] for i in c) for c in clusters(ntrain, duplicates)],
+        leakage,
+    )
@@ -3,7 +3,8 @@ from typing import List, Optional
 
 from IPython.display import display
 
-from .core import ImageTrainerMixin, img_handle, sample_from_iterable
+from .browser import FileIndex
+from .core import ImageTrainerMixin, img_handle
 from .widgets import GPUIndex, Solver
 
 
@@ -98,10 +99,9 @@ class OCR(ImageTrainerMixin):
                 if len(x.split()) >= 2
             }
 
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(self.file_dict.keys(), 10)
-            ]
+            self.browser.load(
+                FileIndex([fh.as_posix() for fh in self.file_dict.keys()])
+            )
 
     def update_test_file_list(self, *args):
         with self.output:
@@ -112,7 +112,6 @@ class OCR(ImageTrainerMixin):
                 if len(x.split()) >= 2
             }
 
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(self.file_dict.keys(), 10)
-            ]
+            self.browser.load(
+                FileIndex([fh.as_posix() for fh in self.file_dict.keys()])
+            )
@@ -0,0 +1,284 @@
+import os
+from collections import defaultdict
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import cv2
+
+from .cache import cache_path
+from .corpus import label_files
+from .minhash import clusters
+
+# number of set bits for each byte value
+_popcount_table = np.array([bin(i).count("1") for i in range(256)], np.uint8)
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # numpy >= 2.0
+        return np.bitwise_count(x)
+    return (
+        _popcount_table[x.view(np.uint8)]
+        .reshape(x.shape + (8,))
+        .sum(axis=-1, dtype=np.uint8)
+    )
+
+
+def _pack(bits: np.ndarray) -> int:
+    return int(np.packbits(bits.ravel()).view(">u8")[0])
+
+
+def dhash(gray: np.ndarray) -> int:
+    """Difference hash: sign of the horizontal gradient on a 9x8 thumbnail"""
+    small = cv2.resize(gray, (9, 8), interpolation=cv2.INTER_AREA)
+    return _pack(small[:, 1:] > small[:, :-1])
+
+
+def phash(gray: np.ndarray) -> int:
+    """Perceptual hash: low frequencies of the DCT compared to their median"""
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA)
+    low = cv2.dct(small.astype(np.float32))[:8, :8]
+    return _pack(low > np.median(low))
+
+
+hash_functions = {"dhash": dhash, "phash": phash}
+
+
+def _hash_chunk(args):
+    files, method = args
+    fun = hash_functions[method]
+    hashes = np.zeros(len(files), dtype=np.uint64)
+    valid = np.zeros(len(files), dtype=bool)
+    for i, fname in enumerate(files):
+        # a 32x32 thumbnail does not need the full resolution
+        gray = cv2.imread(fname, cv2.IMREAD_REDUCED_GRAYSCALE_2)
+        if gray is None:
+            continue
+        hashes[i] = fun(gray)
+        valid[i] = True
+    return hashes, valid
+
+
+def image_files(repo: Path) -> List[Tuple[str, str]]:
+    """(label, image) pairs for a directory per label, or for a list file
+    where the list file itself plays the role of the label"""
+    repo = Path(repo)
+    if repo.is_dir():
+        return list(label_files(repo))
+    return [
+        (repo.name, line.split()[0])
+        for line in repo.read_text().split("\n")
+        if len(line.split()) >= 2
+    ]
+
+
+def hash_index(
+    files: List[str],
+    method: str = "dhash",
+    processes: Optional[int] = None,
+    chunksize: int = 256,
+    index: Optional[Path] = None,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Perceptual hashes (uint64) of the files, and a mask of the files which
+    could be read.
+
+    Hashes are stored on disk in `index` (by default in the user cache) and
+    are only computed again for files whose modification time changed.
+    """
+    if index is None:
+        common = os.path.commonpath(files) if len(files) > 0 else ""
+        index = cache_path("phash", method, common)
+    index = Path(index)
+
+    mtimes = np.array(
+        [os.stat(f).st_mtime_ns if os.path.exists(f) else -1 for f in files],
+        dtype=np.int64,
+    )
+    hashes = np.zeros(len(files), dtype=np.uint64)
+    valid = np.zeros(len(files), dtype=bool)
+    todo = np.ones(len(files), dtype=bool)
+
+    if index.exists():
+        with np.load(index.as_posix()) as cached:
+            known = {
+                (f, m): (h, v)
+                for f, m, h, v in zip(
+                    cached["files"],
+                    cached["mtimes"],
+                    cached["hashes"],
+                    cached["valid"],
+                )
+            }
+        for i, key in enumerate(zip(files, mtimes)):
+            if key in known:
+                hashes[i], valid[i] = known[key]
+                todo[i] = False
+
+    missing = np.flatnonzero(todo)
+    if len(missing) > 0:
+        chunks = [
+            ([files[i] for i in missing[k : k + chunksize]], method)
+            for k in range(0, len(missing), chunksize)
+        ]
+        with Pool(processes) as pool:
+            results = pool.map(_hash_chunk, chunks)
+        hashes[missing] = np.concatenate([h for h, _ in results])
+        valid[missing] = np.concatenate([v for _, v in results])
+        np.savez(
+            index.as_posix(),
+            files=np.array(files, dtype=str),
+            mtimes=mtimes,
+            hashes=hashes,
+            valid=valid,
+        )
+
+    return hashes, valid
+
+
+def _hamming_block(
+    a: np.ndarray, b: np.ndarray, same: bool, max_distance: int, block: int
+) -> np.ndarray:
+    # brute force, by blocks of rows of the distance matrix
+    result = [np.empty((0, 3), dtype=np.int64)]
+    for start in range(0, len(a), block):
+        rows = a[start : start + block]
+        offset = start if same else 0
+        dist = popcount(np.bitwise_xor(rows[:, None], b[None, offset:]))
+        i, j = np.nonzero(dist <= max_distance)
+        if same:
+            keep = j > i
+            i, j = i[keep], j[keep]
+        result.append(
+            np.stack([i + start, j + offset, dist[i, j]], axis=1).astype(
+                np.int64
+            )
+        )
+    return np.concatenate(result)
+
+
+def hamming_pairs(
+    a: np.ndarray,
+    b: Optional[np.ndarray] = None,
+    max_distance: int = 4,
+    block_elements: int = 1 << 24,
+) -> np.ndarray:
+    """(i, j, distance) rows for the hashes a[i], b[j] within max_distance.
+
+    Without b, pairs are searched within a (with i < j). Two hashes within
+    max_distance bits agree on at least one of max_distance + 1 disjoint bit
+    ranges, hence only hashes sharing the value of a range are compared.
+    """
+    same = b is None
+    if same:
+        b = a
+    block = max(1, block_elements // max(1, len(b)))
+    nchunks = max_distance + 1
+    if nchunks > 8:  # bit ranges too narrow to discriminate anything
+        return _hamming_block(a, b, same, max_distance, block)
+
+    result = [np.empty((0, 3), dtype=np.int64)]
+    bounds = np.linspace(0, 64, nchunks + 1).astype(int)
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        mask = np.uint64((1 << int(hi - lo)) - 1)
+        ka = (a >> np.uint64(lo)) & mask
+        oa = np.argsort(ka, kind="stable")
+        ua, sa, ca = np.unique(ka[oa], return_index=True, return_counts=True)
+        if same:
+            for s, c in zip(sa[ca > 1], ca[ca > 1]):
+                idx = oa[s : s + c]  # sorted, hence i < j is preserved
+                pairs = _hamming_block(
+                    a[idx], a[idx], True, max_distance, block
+                )
+                pairs[:, 0] = idx[pairs[:, 0]]
+                pairs[:, 1] = idx[pairs[:, 1]]
+                result.append(pairs)
+        else:
+            kb = (b >> np.uint64(lo)) & mask
+            ob = np.argsort(kb, kind="stable")
+            ub, sb, cb = np.unique(
+                kb[ob], return_index=True, return_counts=True
+            )
+            _, ia, ib = np.intersect1d(ua, ub, return_indices=True)
+            for x, y in zip(ia, ib):
+                idx_a = oa[sa[x] : sa[x] + ca[x]]
+                idx_b = ob[sb[y] : sb[y] + cb[y]]
+                pairs = _hamming_block(
+                    a[idx_a], b[idx_b], False, max_distance, block
+                )
+                pairs[:, 0] = idx_a[pairs[:, 0]]
+                pairs[:, 1] = idx_b[pairs[:, 1]]
+                result.append(pairs)
+
+    # a pair is found once per bit range on which both hashes agree
+    return np.unique(np.concatenate(result), axis=0)
+
+
+class ImageDuplicateReport(NamedTuple):
+    # groups of near-duplicate training images, by label (several labels
+    # joined with '|' when the same picture appears in different classes)
+    groups: Dict[str, List[List[str]]]
+    # (testing image, training image, Hamming distance), by testing label
+    leakage: Dict[str, List[Tuple[str, str, int]]]
+    unreadable: List[str]
+
+    def summary(self) -> str:
+        lines = []
+        for label, groups in sorted(self.groups.items()):
+            lines.append(
+                "{label}: {n} duplicate groups ({k} redundant images)".format(
+                    label=label,
+                    n=len(groups),
+                    k=sum(len(g) - 1 for g in groups),
+                )
+            )
+        for label, pairs in sorted(self.leakage.items()):
+            lines.append(
+                "{label}: {n} testing images leak from the training set".format(
+                    label=label, n=len(set(test for test, _, _ in pairs))
+                )
+            )
+        if self.unreadable:
+            lines.append("{} unreadable images".format(len(self.unreadable)))
+        if not lines:
+            lines.append("No duplicate found")
+        return "\n".join(lines)
+
+
+def image_duplicates(
+    training_repo: Path,
+    testing_repo: Optional[Path] = None,
+    method: str = "dhash",
+    max_distance: int = 4,
+    processes: Optional[int] = None,
+) -> ImageDuplicateReport:
+    """Near-duplicate images within `training_repo` and between
+    `training_repo` and `testing_repo` (label directories or list files)"""
+    train = image_files(Path(training_repo))
+    test = image_files(Path(testing_repo)) if testing_repo else []
+    files = [f for _, f in train + test]
+    hashes, valid = hash_index(files, method, processes)
+    unreadable = [f for f, v in zip(files, valid) if not v]
+
+    ntrain = len(train)
+    train_idx = np.flatnonzero(valid[:ntrain])
+    test_idx = np.flatnonzero(valid[ntrain:]) + ntrain
+
+    groups = defaultdict(list)  # typing: Dict[str, List[List[str]]]
+    pairs = hamming_pairs(hashes[train_idx], max_distance=max_distance)
+    for group in clusters(len(train_idx), pairs[:, :2]):
+        members = [train[train_idx[i]] for i in group]
+        label = "|".join(sorted(set(label for label, _ in members)))
+        groups[label].append(sorted(f for _, f in members))
+
+    leakage = defaultdict(list)  # typing: Dict[str, List[Tuple[str, str, int]]]
+    if len(test_idx) > 0:
+        pairs = hamming_pairs(
+            hashes[test_idx], hashes[train_idx], max_distance=max_distance
+        )
+        for i, j, d in pairs:
+            label, fname = test[test_idx[i] - ntrain]
+            leakage[label].append((fname, train[train_idx[j]][1], int(d)))
+
+    return ImageDuplicateReport(dict(groups), dict(leakage), unreadable)
@@ -0,0 +1,184 @@
+import os
+from collections import Counter
+from multiprocessing import Pool
+from pathlib import Path
+from typing import NamedTuple, Optional, Tuple
+
+import cv2
+
+from .corpus import label_files
+from .imageinfo import image_size, oriented, reduced_flag
+
+
+class Target(NamedTuple):
+    max_side: Optional[int] = None
+    size: Optional[Tuple[int, int]] = None  # exact (width, height)
+    extension: str = ".jpg"
+    quality: int = 95
+
+    def shape(self, width: int, height: int) -> Tuple[int, int]:
+        if self.size is not None:
+            return self.size
+        if self.max_side is None or max(width, height) <= self.max_side:
+            return width, height
+        scale = self.max_side / max(width, height)
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def _up_to_date(src: str, dst: str) -> bool:
+    return os.path.exists(dst) and (
+        os.stat(dst).st_mtime >= os.stat(src).st_mtime
+    )
+
+
+def _resize_item(args) -> str:
+    target, kind, image, image_dst, annotation, annotation_dst = args
+    try:
+        if _up_to_date(image, image_dst) and (
+            kind not in ("bbox", "mask")
+            or _up_to_date(annotation, annotation_dst)
+        ):
+            return "skipped"
+        size = image_size(image)
+        if size is None:
+            return "failed"
+        new = target.shape(*size)
+        os.makedirs(os.path.dirname(image_dst), exist_ok=True)
+
+        if not _up_to_date(image, image_dst):
+            data = cv2.imread(image, reduced_flag(size[0], size[1], *new))
+            if data is None:
+                return "failed"
+            # as decoded, should cv2 turn it otherwise than the header says
+            size = oriented(size, data.shape)
+            new = target.shape(*size)
+            data = cv2.resize(data, new, interpolation=cv2.INTER_AREA)
+            params = []  # typing: List[int]
+            if target.extension.lower() in (".jpg", ".jpeg"):
+                params = [cv2.IMWRITE_JPEG_QUALITY, target.quality]
+            if not cv2.imwrite(image_dst, data, params):
+                return "failed"
+
+        if kind == "mask":
+            os.makedirs(os.path.dirname(annotation_dst), exist_ok=True)
+            mask = cv2.imread(annotation, cv2.IMREAD_UNCHANGED)
+            mask = cv2.resize(mask, new, interpolation=cv2.INTER_NEAREST)
+            if not cv2.imwrite(annotation_dst, mask):
+                return "failed"
+
+        if kind == "bbox":
+            os.makedirs(os.path.dirname(annotation_dst), exist_ok=True)
+            sx, sy = new[0] / size[0], new[1] / size[1]
+            lines = []  # typing: List[str]
+            with open(annotation, "r") as fh:
+                for line in fh:
+                    if len(line.split()) < 5:
+                        continue
+                    tag, xmin, ymin, xmax, ymax = (
+                        float(x) for x in line.split()[:5]
+                    )
+                    lines.append(
+                        "{} {} {} {} {}\n".format(
+                            int(tag),
+                            round(xmin * sx),
+                            round(ymin * sy),
+                            round(xmax * sx),
+                            round(ymax * sy),
+                        )
+                    )
+            with open(annotation_dst, "w") as fh:
+                fh.writelines(lines)
+    except (OSError, ValueError, cv2.error):
+        return "failed"
+    return "resized"
+
+
+class ResizeReport(NamedTuple):
+    repo: Path  # mirrored training_repo or testing_repo
+    counts: Counter
+
+    def summary(self) -> str:
+        return "{}: {} resized, {} up to date, {} failed".format(
+            self.repo,
+            self.counts["resized"],
+            self.counts["skipped"],
+            self.counts["failed"],
+        )
+
+
+def _mirror(root: str, path: str, dst: Path, extension: str = "") -> str:
+    rel = os.path.relpath(path, root)
+    if extension:
+        rel = os.path.splitext(rel)[0] + extension
+    return (dst / rel).as_posix()
+
+
+def resize_dataset(
+    repo: Path,
+    dst: Path,
+    kind: str = "image",
+    max_side: Optional[int] = None,
+    size: Optional[Tuple[int, int]] = None,
+    extension: str = ".jpg",
+    quality: int = 95,
+    processes: Optional[int] = None,
+) -> ResizeReport:
+    """Writes a resized mirror of a dataset in dst/<repo name> and returns
+    the repository to use instead.
+
+    The repository is either a directory per label, or a list file where the
+    second column is a bbox file (kind="bbox"), a mask (kind="mask") or
+    anything else written unchanged (kind="image", for OCR or Regression).
+    Images are resized to fit max_side, or to the exact size (width, height),
+    and files already more recent than their source are skipped.
+    """
+    repo = Path(repo)
+    target = Target(max_side, size, extension, quality)
+    dst = Path(dst) / repo.stem
+    items = []  # typing: List[Tuple]
+
+    if repo.is_dir():
+        mirror = dst
+        for _, image in label_files(repo):
+            items.append(
+                (
+                    target,
+                    "image",
+                    image,
+                    _mirror(repo.as_posix(), image, dst, extension),
+                    None,
+                    None,
+                )
+            )
+    else:
+        mirror = dst / repo.name
+        lines = [
+            x.split()
+            for x in repo.read_text().split("\n")
+            if len(x.split()) >= 2
+        ]
+        images = [x[0] for x in lines]
+        root = os.path.dirname(os.path.commonpath(images)) if images else ""
+        if kind in ("bbox", "mask"):
+            annotations = [x[1] for x in lines]
+            aroot = os.path.dirname(os.path.commonpath(annotations))
+        list_lines = []  # typing: List[str]
+        for x in lines:
+            image_dst = _mirror(root, x[0], dst / "images", extension)
+            annotation, annotation_dst = None, None
+            rest = x[1:]
+            if kind in ("bbox", "mask"):
+                annotation = x[1]
+                annotation_dst = _mirror(aroot, x[1], dst / kind)
+                rest = [annotation_dst]
+            items.append(
+                (target, kind, x[0], image_dst, annotation, annotation_dst)
+            )
+            list_lines.append(" ".join([image_dst] + rest) + "\n")
+        dst.mkdir(parents=True, exist_ok=True)
+        mirror.write_text("".join(list_lines))
+
+    with Pool(processes) as pool:
+        counts = Counter(pool.imap_unordered(_resize_item, items, 64))
+
+    return ResizeReport(mirror, counts)
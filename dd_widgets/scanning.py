@@ -0,0 +1,90 @@
+import os
+import threading
+import time
+from typing import Any, Callable, List, Optional
+
+
+class Debouncer:
+    """Calls fun with the arguments of the last call, once calls have
+    stopped for `delay` seconds"""
+
+    def __init__(self, fun: Callable, delay: float = 0.5) -> None:
+        self.fun = fun
+        self.delay = delay
+        self._timer = None  # typing: Optional[threading.Timer]
+        self._lock = threading.Lock()
+
+    def __call__(self, *args: Any) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(self.delay, self.fun, args)
+            self._timer.daemon = True
+            self._timer.start()
+
+
+class DirectoryScanner:
+    """Lists the sub-directories of a path in a background thread.
+
+    Each call to scan supersedes the previous ones: a superseded scan stops
+    at its next entry and never reports. A scan stops after `timeout`
+    seconds or `max_entries` entries and reports what it found so far.
+    on_done receives (path, names, message) where message is empty unless
+    the scan failed or was truncated.
+    """
+
+    def __init__(
+        self,
+        on_done: Callable[[str, List[str], str], None],
+        on_progress: Optional[Callable[[str, int], None]] = None,
+        timeout: float = 5.0,
+        max_entries: int = 100000,
+        progress_every: int = 1000,
+    ) -> None:
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.timeout = timeout
+        self.max_entries = max_entries
+        self.progress_every = progress_every
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def scan(self, path: str) -> None:
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        thread = threading.Thread(
+            target=self._run, args=(generation, path), daemon=True
+        )
+        thread.start()
+
+    def cancel(self) -> None:
+        with self._lock:
+            self._generation += 1
+
+    def _current(self, generation: int) -> bool:
+        return generation == self._generation
+
+    def _run(self, generation: int, path: str) -> None:
+        start = time.monotonic()
+        names = []  # typing: List[str]
+        message = ""
+        try:
+            with os.scandir(path) as it:
+                for n, entry in enumerate(it, 1):
+                    if not self._current(generation):
+                        return
+                    if entry.is_dir():
+                        names.append(entry.name)
+                    if n >= self.max_entries:
+                        message = "stopped after {} entries".format(n)
+                        break
+                    if time.monotonic() - start > self.timeout:
+                        message = "stopped after {:.0f}s".format(self.timeout)
+                        break
+                    if self.on_progress and n % self.progress_every == 0:
+                        self.on_progress(path, n)
+        except OSError as e:
+            message = e.strerror or str(e)
+        if self._current(generation):
+            self.on_done(path, sorted(names), message)
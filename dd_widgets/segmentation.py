@@ -3,7 +3,10 @@ from typing import List, Optional
 
 from IPython.display import display
 
+from ipywidgets import Button, Dropdown, HBox
+
 from .core import ImageTrainerMixin, img_handle
+from .segstats import class_frequencies
 from .widgets import GPUIndex, Solver
 
 
@@ -76,6 +79,32 @@ class Segmentation(ImageTrainerMixin):
 
         super().__init__(sname, locals())
 
+        self.weights_method = Dropdown(
+            options=["median", "inverse"], layout={"width": "100px"}
+        )
+        self.weights_button = Button(description="Compute class weights")
+        self.weights_button.on_click(self.compute_class_weights)
+        self._img_explorer.children = (
+            HBox([self.weights_button, self.weights_method]),
+        ) + self._img_explorer.children
+
+    def compute_class_weights(self, *_):
+        self.output.clear_output()
+        with self.output:
+            frequencies = class_frequencies(Path(self.training_repo.value))
+            print(frequencies.summary())
+            if int(self.nclasses.value) <= 0:
+                # e.g. 255 for ignored pixels would count as a class
+                print("Set nclasses to fill class_weights")
+                return None
+            weights = frequencies.weights(
+                self.weights_method.value,
+                nclasses=int(self.nclasses.value),
+                ignore_label=int(self.ignore_label.value),
+            )
+            self.class_weights.value = str(weights)
+            return weights
+
     def display_img(self, args):
         self.output.clear_output()
         with self.output:
@@ -0,0 +1,234 @@
+import os
+from multiprocessing import Pool
+from pathlib import Path
+from typing import List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+import cv2
+
+from .cache import cache_path
+
+
+def mask_files(list_file: Path) -> List[str]:
+    """Masks referenced by a segmentation list file (image mask per line)"""
+    return [
+        line.split()[1]
+        for line in Path(list_file).read_text().split("\n")
+        if len(line.split()) >= 2
+    ]
+
+
+# histogram of a mask: labels present and their pixel counts
+Histogram = Tuple[np.ndarray, np.ndarray]
+
+
+class _Totals:
+    """Running per-class sums over masks, grown with the largest label"""
+
+    def __init__(self) -> None:
+        self.pixels = np.zeros(1, dtype=np.int64)
+        self.images = np.zeros(1, dtype=np.int64)
+        self.image_pixels = np.zeros(1, dtype=np.int64)
+
+    def _grow(self, length: int) -> None:
+        if length > len(self.pixels):
+            self.pixels = _resize(self.pixels, length)
+            self.images = _resize(self.images, length)
+            self.image_pixels = _resize(self.image_pixels, length)
+
+    def add(self, labels: np.ndarray, counts: np.ndarray) -> None:
+        if len(labels) == 0:
+            return
+        self._grow(int(labels.max()) + 1)
+        self.pixels[labels] += counts
+        self.images[labels] += 1
+        self.image_pixels[labels] += counts.sum()
+
+    def merge(self, other: "_Totals") -> None:
+        self._grow(len(other.pixels))
+        n = len(other.pixels)
+        self.pixels[:n] += other.pixels
+        self.images[:n] += other.images
+        self.image_pixels[:n] += other.image_pixels
+
+
+def _histogram_chunk(
+    files: List[str],
+) -> Tuple[List[Optional[Histogram]], _Totals]:
+    result = []  # typing: List[Optional[Histogram]]
+    totals = _Totals()
+    for fname in files:
+        # same flag as img_handle: masks hold indices, not colors
+        data = cv2.imread(fname, cv2.IMREAD_UNCHANGED)
+        if data is None:
+            result.append(None)
+            continue
+        if data.ndim == 3:
+            data = data[:, :, 0]
+        hist = np.bincount(data.ravel())
+        labels = np.flatnonzero(hist)
+        counts = hist[labels].astype(np.int64)
+        result.append((labels, counts))
+        totals.add(labels, counts)
+    return result, totals
+
+
+def _resize(values: np.ndarray, length: int) -> np.ndarray:
+    if len(values) >= length:
+        return values[:length]
+    return np.pad(values, (0, length - len(values)), mode="constant")
+
+
+class ClassFrequencies(NamedTuple):
+    pixels: np.ndarray  # number of pixels per class
+    images: np.ndarray  # number of masks where each class is present
+    image_pixels: np.ndarray  # total pixels of the masks containing a class
+    unreadable: List[str]
+
+    @property
+    def frequencies(self) -> np.ndarray:
+        return self.pixels / max(1, self.pixels.sum())
+
+    def weights(
+        self,
+        method: str = "median",
+        nclasses: int = -1,
+        ignore_label: int = -1,
+    ) -> List[float]:
+        """Class weights for the loss, ready for `class_weights`.
+
+        - median: median frequency balancing (Eigen & Fergus), where the
+          frequency of a class is computed over the masks containing it;
+        - inverse: total / (nclasses * pixels of the class).
+
+        Absent (or ignored) classes get a null weight. With nclasses, there
+        are exactly nclasses weights: labels beyond, such as 255 for ignored
+        pixels, are left out. Without, there is one weight up to the largest
+        label present other than ignore_label.
+        """
+        n = nclasses
+        if n <= 0:
+            labels = np.flatnonzero(self.pixels)
+            labels = labels[labels != ignore_label]
+            n = int(labels[-1]) + 1 if len(labels) > 0 else 0
+        pixels = _resize(self.pixels, n).astype(np.float64)
+        image_pixels = _resize(self.image_pixels, n).astype(np.float64)
+        if 0 <= ignore_label < n:
+            pixels[ignore_label] = 0
+        present = pixels > 0
+
+        weights = np.zeros(n)
+        if method == "median":
+            freq = pixels[present] / image_pixels[present]
+            weights[present] = np.median(freq) / freq
+        elif method == "inverse":
+            weights[present] = pixels.sum() / (
+                np.count_nonzero(present) * pixels[present]
+            )
+        else:
+            raise ValueError("Unknown method {}".format(method))
+        return [round(float(w), 4) for w in weights]
+
+    def summary(self) -> str:
+        lines = ["class pixels (%) images"]
+        for c, (p, f, i) in enumerate(
+            zip(self.pixels, self.frequencies, self.images)
+        ):
+            if p == 0:
+                continue  # absent label, e.g. below 255 for ignored pixels
+            lines.append(
+                "{c:5d} {p:12d} ({f:6.2%}) {i:8d}".format(c=c, p=p, f=f, i=i)
+            )
+        if self.unreadable:
+            lines.append("{} unreadable masks".format(len(self.unreadable)))
+        return "\n".join(lines)
+
+
+def class_frequencies(
+    list_file: Path,
+    processes: Optional[int] = None,
+    chunksize: int = 64,
+    index: Optional[Path] = None,
+) -> ClassFrequencies:
+    """Pixel and image counts per class over the masks of a list file.
+
+    The labels and pixel counts of each mask are stored in `index` (by
+    default in the user cache) and only masks whose modification time
+    changed are read again.
+    """
+    files = mask_files(list_file)
+    if index is None:
+        index = cache_path("segstats", Path(list_file).resolve().as_posix())
+    index = Path(index)
+
+    mtimes = np.array(
+        [os.stat(f).st_mtime_ns if os.path.exists(f) else -1 for f in files],
+        dtype=np.int64,
+    )
+    hists = [None] * len(files)  # typing: List[Optional[Histogram]]
+    todo = list(range(len(files)))
+    totals = _Totals()
+
+    if index.exists():
+        with np.load(index.as_posix()) as cached:
+            offsets = cached["offsets"]
+            labels, counts = cached["labels"], cached["counts"]
+            known = {
+                (f, m): ((labels[a:b], counts[a:b]) if v else None)
+                for f, m, v, a, b in zip(
+                    cached["files"],
+                    cached["mtimes"],
+                    cached["valid"],
+                    offsets[:-1],
+                    offsets[1:],
+                )
+            }
+        todo = []
+        for i, key in enumerate(zip(files, mtimes)):
+            if key in known:
+                hists[i] = known[key]
+                if hists[i] is not None:
+                    totals.add(*hists[i])
+            else:
+                todo.append(i)
+
+    if len(todo) > 0:
+        chunks = [
+            [files[i] for i in todo[k : k + chunksize]]
+            for k in range(0, len(todo), chunksize)
+        ]
+        with Pool(processes) as pool:
+            results = pool.map(_histogram_chunk, chunks)
+        for i, hist in zip(todo, (h for r, _ in results for h in r)):
+            hists[i] = hist
+        for _, chunk_totals in results:
+            totals.merge(chunk_totals)
+
+    valid = np.array([h is not None for h in hists], dtype=bool)
+
+    if len(todo) > 0:
+        present = [h for h in hists if h is not None]
+        sizes = [len(labels) for labels, _ in present]
+        offsets = np.zeros(len(files) + 1, dtype=np.int64)
+        offsets[1:][valid] = sizes
+        np.savez(
+            index.as_posix(),
+            files=np.array(files, dtype=str),
+            mtimes=mtimes,
+            valid=valid,
+            offsets=np.cumsum(offsets),
+            labels=np.concatenate(
+                [labels for labels, _ in present] + [np.zeros(0, np.int64)]
+            ),
+            counts=np.concatenate(
+                [counts for _, counts in present] + [np.zeros(0, np.int64)]
+            ),
+        )
+
+    return ClassFrequencies(
+        pixels=totals.pixels,
+        images=totals.images,
+        image_pixels=totals.image_pixels,
+        unreadable=[f for f, v in zip(files, valid) if not v],
+    )
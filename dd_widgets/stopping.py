@@ -0,0 +1,236 @@
+"""Rules stopping a training early, evaluated on each poll of the job.
+
+Rules keep state between polls: use one instance per job.
+"""
+
+import copy
+import math
+import numbers
+import os
+import re
+import shutil
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+from .metrics import MetricHistory
+
+
+class Stop(NamedTuple):
+    reason: str
+    iteration: Optional[int]  # of the snapshot worth keeping
+
+
+class StoppingRule(ABC):
+    @abstractmethod
+    def check(
+        self, measure: Dict[str, Any], history: MetricHistory
+    ) -> Optional[Stop]:
+        """Stop if the training should stop after this poll, else None"""
+
+
+def _last_finite_iteration(history: MetricHistory, name: str):
+    if "iteration" not in history or name not in history:
+        return None
+    finite = np.flatnonzero(np.isfinite(history[name]))
+    if len(finite) == 0:
+        return None
+    return int(history["iteration"][finite[-1]])
+
+
+class NonFinite(StoppingRule):
+    """Stops as soon as one of the measures is NaN or infinite"""
+
+    def __init__(self, measures=("train_loss",)) -> None:
+        self.measures = measures
+
+    def check(self, measure, history):
+        for name in self.measures:
+            value = measure.get(name)
+            if isinstance(value, numbers.Real) and not math.isfinite(value):
+                return Stop(
+                    "{} is {}".format(name, value),
+                    _last_finite_iteration(history, name),
+                )
+        return None
+
+
+class _Improvement(StoppingRule):
+    def __init__(self, measure: str, mode: str, min_delta: float) -> None:
+        if mode not in ("min", "max"):
+            raise ValueError("mode is min or max, not {}".format(mode))
+        self.measure = measure
+        self.mode = mode
+        self.min_delta = min_delta
+        self.best = None  # typing: Optional[float]
+        self.best_iteration = None  # typing: Optional[int]
+        self._seen = 0
+
+    def _improves(self, value: float) -> bool:
+        if self.best is None:
+            return True
+        if self.mode == "min":
+            return value < self.best - self.min_delta
+        return value > self.best + self.min_delta
+
+    def _new_samples(self, history: MetricHistory):
+        """(iteration, value) of the finite samples since the last call"""
+        if self.measure not in history or "iteration" not in history:
+            return []
+        start, self._seen = self._seen, len(history)
+        return [
+            (int(i), v)
+            for i, v in zip(
+                history["iteration"][start:].tolist(),
+                history[self.measure][start:].tolist(),
+            )
+            if math.isfinite(v)
+        ]
+
+
+class Patience(_Improvement):
+    """Stops when the measure did not improve by more than min_delta during
+    `patience` iterations"""
+
+    def __init__(
+        self,
+        measure: str = "train_loss",
+        patience: int = 5000,
+        mode: str = "min",
+        min_delta: float = 0.0,
+    ) -> None:
+        super().__init__(measure, mode, min_delta)
+        self.patience = patience
+        self._iteration = None  # typing: Optional[int]
+
+    def check(self, measure, history):
+        for iteration, value in self._new_samples(history):
+            self._iteration = iteration
+            if self._improves(value):
+                self.best, self.best_iteration = value, iteration
+        if (
+            self.best_iteration is not None
+            and self._iteration - self.best_iteration >= self.patience
+        ):
+            return Stop(
+                "no improvement of {} over {:.4g} (iteration {}) "
+                "for {} iterations".format(
+                    self.measure,
+                    self.best,
+                    self.best_iteration,
+                    self._iteration - self.best_iteration,
+                ),
+                self.best_iteration,
+            )
+        return None
+
+
+class Plateau(_Improvement):
+    """Stops when the last `intervals` evaluations of a test measure did not
+    improve it by more than min_delta. Test measures are repeated between
+    tests: a new evaluation starts each test_interval iterations, or, if
+    test_interval is None, when the value changes."""
+
+    def __init__(
+        self,
+        measure: str = "map",
+        intervals: int = 5,
+        mode: str = "max",
+        min_delta: float = 0.0,
+        test_interval: Optional[int] = None,
+    ) -> None:
+        super().__init__(measure, mode, min_delta)
+        self.intervals = intervals
+        self.test_interval = test_interval
+        self._last = None  # typing: Optional[float]
+        self._stale = 0
+
+    def check(self, measure, history):
+        for iteration, value in self._new_samples(history):
+            if self.test_interval:
+                key = iteration // self.test_interval
+            else:
+                key = value
+            if key == self._last:
+                continue
+            self._last = key
+            if self._improves(value):
+                self.best, self.best_iteration = value, iteration
+                self._stale = 0
+            else:
+                self._stale += 1
+        if self._stale >= self.intervals:
+            return Stop(
+                "no improvement of {} over {:.4g} (iteration {}) "
+                "in {} test intervals".format(
+                    self.measure, self.best, self.best_iteration, self._stale
+                ),
+                self.best_iteration,
+            )
+        return None
+
+
+rules = {"nonfinite": NonFinite, "patience": Patience, "plateau": Plateau}
+
+
+def rule_from_config(config: Dict[str, Any]) -> StoppingRule:
+    """e.g. {"rule": "patience", "measure": "train_loss", "patience": 5000}"""
+    config = dict(config)
+    name = config.pop("rule")
+    if name not in rules:
+        raise ValueError(
+            "Unknown stopping rule {}, expected one of {}".format(
+                name, ", ".join(sorted(rules))
+            )
+        )
+    return rules[name](**config)
+
+
+def for_training(
+    stopping_rules: List[StoppingRule], test_interval: Optional[int]
+) -> List[StoppingRule]:
+    """Fresh copies of the rules for a new training"""
+    copies = copy.deepcopy(stopping_rules)
+    for rule in copies:
+        if isinstance(rule, Plateau) and rule.test_interval is None:
+            rule.test_interval = test_interval
+    return copies
+
+
+def check_rules(
+    stopping_rules: List[StoppingRule],
+    measure: Dict[str, Any],
+    history: MetricHistory,
+) -> Optional[Stop]:
+    for rule in stopping_rules:
+        stop = rule.check(measure, history)
+        if stop is not None:
+            return stop
+    return None
+
+
+_snapshot = re.compile(r"_iter_(\d+)\.")
+
+
+def keep_best_snapshot(model_repo: Path, iteration: Optional[int]) -> List[str]:
+    """Copies the files of the last snapshot taken at or before iteration to
+    model_repo/best, where deleting the service or later trainings do not
+    touch them. Returns the names of the files copied"""
+    if iteration is None or not os.path.isdir(str(model_repo)):
+        return []
+    snapshots = {}  # typing: Dict[int, List[str]]
+    for name in os.listdir(str(model_repo)):
+        match = _snapshot.search(name)
+        if match is not None:
+            snapshots.setdefault(int(match.group(1)), []).append(name)
+    candidates = [x for x in snapshots if x <= iteration]
+    if len(candidates) == 0:
+        return []
+    names = sorted(snapshots[max(candidates)])
+    best = Path(model_repo) / "best"
+    best.mkdir(exist_ok=True)
+    for name in names:
+        shutil.copy2(str(Path(model_repo) / name), str(best / name))
+    return names
@@ -0,0 +1,293 @@
+"""Hyperparameter sweeps: trials of a task over a grid or a random sample of
+parameter values, run as headless jobs.
+
+    sweep = Sweep(
+        "Detection",
+        dict(sname="det", model_repo="/models/det", ...),
+        {"base_lr": [1e-3, 1e-4], "solver_type": ["SGD", "ADAM"]},
+        measure="map",
+    )
+    sweep.run()
+    sweep.table()
+
+Each trial gets its own service name, sname_003, and model repository,
+model_repo/sname_003. At most `max_running` trials run at the same time on
+each server; with a GPUPlacement, trials on its host also wait for free GPUs
+and get them as gpuid.
+"""
+
+import itertools
+import logging
+import math
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import requests
+
+from .gpus import GPUPlacement
+from .headless import Job
+from .loghandler import LazyJSON
+
+
+class Uniform(NamedTuple):
+    """Continuous range of a random search, e.g. Uniform(1e-5, 1e-2, log=True)
+    """
+
+    low: float
+    high: float
+    log: bool = False
+
+    def sample(self, rng: random.Random) -> float:
+        if self.log:
+            return math.exp(
+                rng.uniform(math.log(self.low), math.log(self.high))
+            )
+        return rng.uniform(self.low, self.high)
+
+
+def grid(space: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """All the combinations of the values of the parameters"""
+    for name, values in space.items():
+        if isinstance(values, Uniform):
+            raise ValueError(
+                "{} is a range, only possible in a random search".format(name)
+            )
+    names = list(space)
+    return [
+        dict(zip(names, values))
+        for values in itertools.product(*(space[x] for x in names))
+    ]
+
+
+def random_search(
+    space: Dict[str, Any], trials: int, seed: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """`trials` random draws, among the values of the parameters or in their
+    Uniform range"""
+    rng = random.Random(seed)
+    return [
+        {
+            name: values.sample(rng)
+            if isinstance(values, Uniform)
+            else rng.choice(list(values))
+            for name, values in space.items()
+        }
+        for _ in range(trials)
+    ]
+
+
+class Trial:
+    def __init__(self, number: int, params: Dict[str, Any], job: Job):
+        self.number = number
+        self.params = params
+        self.job = job
+        self.status = "pending"
+        self.reason = None  # typing: Optional[str]
+        self.placed = None  # typing: Optional[Tuple[int, ...]], GPUs reserved
+
+    @property
+    def server(self):
+        return self.job.host, self.job.port
+
+    def value(self, measure: str) -> Optional[float]:
+        value = self.job.measure.get(measure)
+        if isinstance(value, (int, float)) and math.isfinite(value):
+            return float(value)
+        return None
+
+
+class Sweep:
+    """Trials of `task` with the keyword arguments of the widget in `base`,
+    updated by the values of the parameters in `space`.
+
+    space maps parameter names to lists of values; search is "grid", or
+    "random" for `trials` draws where values may also be a Uniform range.
+    Trials are ranked on the last value of `measure`.
+    """
+
+    def __init__(
+        self,
+        task: str,
+        base: Dict[str, Any],
+        space: Dict[str, Any],
+        search: str = "grid",
+        trials: Optional[int] = None,
+        seed: Optional[int] = None,
+        max_running: int = 1,
+        stopping: Optional[List[Any]] = None,
+        measure: str = "train_loss",
+        maximize: bool = False,
+        placement: Optional[GPUPlacement] = None,
+    ) -> None:
+        if search == "grid":
+            values = grid(space)
+        elif search == "random":
+            if trials is None:
+                raise ValueError("A random search needs a number of trials")
+            values = random_search(space, trials, seed)
+        else:
+            raise ValueError(
+                "search is grid or random, not {}".format(search)
+            )
+        if "sname" not in base:
+            raise ValueError("The base configuration needs a sname")
+        if not base.get("model_repo"):
+            # trials would share it, or all write to the current directory
+            raise ValueError(
+                "The base configuration needs a model_repo, "
+                "where each trial gets its own directory"
+            )
+        self.task = task
+        self.max_running = max_running
+        self.measure = measure
+        self.maximize = maximize
+        self.placement = placement
+        self.trials = []  # typing: List[Trial]
+        for number, params in enumerate(values):
+            kwargs = dict(base, **params)
+            kwargs["sname"] = "{}_{:03d}".format(base["sname"], number)
+            kwargs["model_repo"] = str(
+                Path(base["model_repo"]) / kwargs["sname"]
+            )
+            self.trials.append(
+                Trial(number, params, Job(task, stopping=stopping, **kwargs))
+            )
+        self._thread = None  # typing: Optional[threading.Thread]
+
+    @classmethod
+    def from_widget(cls, widget, space: Dict[str, Any], **kwargs) -> "Sweep":
+        """Sweep around the current parameters of a widget, whose model_repo
+        must be set"""
+        base = widget.parameter_values()
+        base["sname"] = widget.sname
+        return cls(widget.__class__.__name__, base, space, **kwargs)
+
+    def _submit(self, trial: Trial, gpus=None) -> None:
+        placement = self.placement
+        placed = None
+        if placement is not None and trial.job.host == placement.host:
+            if gpus is None:
+                return  # monitor down, retried next round
+            placed = placement.place(len(trial.job.gpuid) or 1, gpus)
+            if placed is None:
+                return
+            trial.job.parameters.gpuid.gpu_ids = placed
+        try:
+            reply = trial.job.run()
+        except (requests.RequestException, RuntimeError, ValueError) as e:
+            logging.error("{}: {}".format(trial.job.sname, e))
+            trial.status, trial.reason = "failed", str(e)
+            if placed is not None:
+                placement.release(placed)
+            return
+        logging.info("%s: %s", trial.job.sname, LazyJSON(reply))
+        trial.status = "running"
+        trial.placed = placed
+
+    def _release(self, trial: Trial) -> None:
+        """Frees the GPUs reserved for a trial which is over"""
+        if trial.placed is not None:
+            self.placement.release(trial.placed)
+            trial.placed = None
+
+    def _poll(self, trial: Trial) -> None:
+        try:
+            info = trial.job.info()
+        except (requests.RequestException, ValueError) as e:
+            logging.warning("{}: {}".format(trial.job.sname, e))
+            return
+        if trial.job.poll(info):
+            self._release(trial)
+            trial.status = trial.job.status or "unknown"
+            trial.reason = trial.job.reason
+            logging.info(
+                "Trial %s: %s, %s %s",
+                trial.job.sname,
+                trial.status,
+                self.measure,
+                trial.value(self.measure),
+            )
+
+    def run(self, interval: float = 10) -> List[Trial]:
+        """Runs the pending trials from one polling loop, returns the trials
+        ranked"""
+        while True:
+            running = [x for x in self.trials if x.status == "running"]
+            for trial in running:
+                self._poll(trial)
+            gpus = None
+            if self.placement is not None and any(
+                x.status == "pending" for x in self.trials
+            ):
+                gpus = self.placement.probe()  # once per round
+            for trial in self.trials:
+                if trial.status != "pending":
+                    continue
+                busy = sum(
+                    1
+                    for x in self.trials
+                    if x.status == "running" and x.server == trial.server
+                )
+                if busy < self.max_running:
+                    self._submit(trial, gpus)
+            if all(
+                x.status not in ("pending", "running") for x in self.trials
+            ):
+                return self.ranked()
+            time.sleep(interval)
+
+    def start(self, interval: float = 10) -> None:
+        """Runs the sweep from a background thread, e.g. in a notebook"""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(
+            target=self.run, args=(interval,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Deletes the services of the running trials, and skips the pending
+        ones"""
+        for trial in self.trials:
+            if trial.status == "pending":
+                trial.status = "skipped"
+            elif trial.status == "running":
+                try:
+                    trial.job.stop()
+                except (requests.RequestException, ValueError) as e:
+                    logging.warning("{}: {}".format(trial.job.sname, e))
+                self._release(trial)
+                trial.job.finish("stopped", trial.job.measure, "sweep stopped")
+                trial.status, trial.reason = "stopped", "sweep stopped"
+
+    def ranked(self) -> List[Trial]:
+        """Trials with a value of the measure, best first, then the others"""
+        scored = [x for x in self.trials if x.value(self.measure) is not None]
+        scored.sort(
+            key=lambda x: x.value(self.measure), reverse=self.maximize
+        )
+        return scored + [x for x in self.trials if x not in scored]
+
+    def table(self):
+        """pandas DataFrame of the ranked trials"""
+        import pandas as pd
+
+        return pd.DataFrame(
+            [
+                dict(
+                    trial.params,
+                    sname=trial.job.sname,
+                    status=trial.status,
+                    iteration=trial.job.measure.get("iteration"),
+                    reason=trial.reason,
+                    **{self.measure: trial.value(self.measure)}
+                )
+                for trial in self.ranked()
+            ],
+            columns=["sname", "status", self.measure, "iteration"]
+            + list(self.trials[0].params if self.trials else [])
+            + ["reason"],
+        )
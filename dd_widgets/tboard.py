@@ -0,0 +1,153 @@
+"""TensorBoard event files, written without TensorFlow: Event protocol
+buffers holding scalar summaries, in TFRecord framing."""
+
+import math
+import os
+import queue
+import socket
+import struct
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+
+def _crc32c_table():
+    table = []
+    for i in range(256):
+        crc = i
+        for _ in range(8):
+            crc = (crc >> 1) ^ (0x82F63B78 if crc & 1 else 0)
+        table.append(crc)
+    return table
+
+
+_table = _crc32c_table()
+
+
+def crc32c(data: bytes) -> int:
+    crc = 0xFFFFFFFF
+    for byte in data:
+        crc = _table[(crc ^ byte) & 0xFF] ^ (crc >> 8)
+    return crc ^ 0xFFFFFFFF
+
+
+def masked_crc32c(data: bytes) -> int:
+    crc = crc32c(data)
+    return (((crc >> 15) | (crc << 17)) + 0xA282EAD8) & 0xFFFFFFFF
+
+
+def record(data: bytes) -> bytes:
+    """TFRecord framing"""
+    length = struct.pack("<Q", len(data))
+    return (
+        length
+        + struct.pack("<I", masked_crc32c(length))
+        + data
+        + struct.pack("<I", masked_crc32c(data))
+    )
+
+
+def _varint(value: int) -> bytes:
+    out = bytearray()
+    value &= 0xFFFFFFFFFFFFFFFF
+    while True:
+        bits = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(bits | 0x80)
+        else:
+            out.append(bits)
+            return bytes(out)
+
+
+def _field(number: int, wire_type: int) -> bytes:
+    return _varint((number << 3) | wire_type)
+
+
+def _bytes_field(number: int, data: bytes) -> bytes:
+    return _field(number, 2) + _varint(len(data)) + data
+
+
+def event(
+    wall_time: float,
+    step: int = 0,
+    scalars: Optional[Dict[str, float]] = None,
+    file_version: Optional[str] = None,
+) -> bytes:
+    """Serialized tensorflow.Event with a Summary of simple values"""
+    out = _field(1, 1) + struct.pack("<d", wall_time)
+    out += _field(2, 0) + _varint(step)
+    if file_version is not None:
+        out += _bytes_field(3, file_version.encode("utf-8"))
+    if scalars:
+        summary = b"".join(
+            _bytes_field(
+                1,
+                _bytes_field(1, tag.encode("utf-8"))
+                + _field(2, 5)
+                + struct.pack("<f", value),
+            )
+            for tag, value in scalars.items()
+        )
+        out += _bytes_field(5, summary)
+    return out
+
+
+class EventWriter:
+    """Writes scalars to an event file of logdir from a background thread,
+    in batches, at most every `flush_secs` seconds. Steps not after the last
+    written one are dropped."""
+
+    def __init__(self, logdir: Path, flush_secs: float = 10.0) -> None:
+        self.logdir = Path(logdir)
+        self.flush_secs = flush_secs
+        self.filename = self.logdir / "events.out.tfevents.{:.0f}.{}".format(
+            time.time(), socket.gethostname()
+        )
+        self._queue = queue.Queue()  # typing: Queue[Optional[bytes]]
+        self._last_step = None  # typing: Optional[int]
+        self._thread = threading.Thread(target=self._write_loop, daemon=True)
+        self._queue.put(record(event(time.time(), file_version="brain.Event:2")))
+        self._thread.start()
+
+    def add_scalars(
+        self,
+        step: int,
+        scalars: Dict[str, float],
+        wall_time: Optional[float] = None,
+    ) -> bool:
+        """Queues the finite scalars of a step, returns whether it was new"""
+        if self._last_step is not None and step <= self._last_step:
+            return False
+        scalars = {k: v for k, v in scalars.items() if math.isfinite(v)}
+        if len(scalars) == 0:
+            return False
+        self._last_step = step
+        wall_time = time.time() if wall_time is None else wall_time
+        self._queue.put(record(event(wall_time, step, scalars)))
+        return True
+
+    def close(self) -> None:
+        """Writes what is queued and stops the thread"""
+        self._queue.put(None)
+        self._thread.join()
+
+    def _write_loop(self) -> None:
+        os.makedirs(str(self.logdir), exist_ok=True)
+        with open(str(self.filename), "ab") as fh:
+            while True:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_secs
+                while batch[-1] is not None:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                fh.write(b"".join(x for x in batch if x is not None))
+                fh.flush()
+                if batch[-1] is None:
+                    return
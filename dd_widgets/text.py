@@ -1,10 +1,13 @@
+import threading
 from collections import OrderedDict
 from pathlib import Path
 from typing import List, Optional
 
-from ipywidgets import HBox, SelectMultiple
+from ipywidgets import Button, HBox, SelectMultiple
 
-from .core import sample_from_iterable
+from .browser import DatasetBrowser
+from .corpus import head, profile_corpus
+from .minhash import near_duplicates
 from .widgets import MLWidget, Solver, GPUIndex
 
 alpha = "abcdefghijklmnopqrstuvwxyz0123456789,;.!?:’\“/\_@#$%^&*~`+-=<>()[]{}"
@@ -78,11 +81,25 @@ class Text(MLWidget):
         self.test_labels.observe(self.update_test_file_list, names="value")
         self.file_list.observe(self.display_text, names="value")
 
+        # both read the whole corpus: run from a thread, not the kernel's
+        self.profile_button = Button(description="Profile corpus")
+        self.profile_button.on_click(
+            lambda button: self._in_background(button, self.profile)
+        )
+        self.duplicates_button = Button(description="Find duplicates")
+        self.duplicates_button.on_click(
+            lambda button: self._in_background(button, self.duplicates)
+        )
+
+        self.browser = DatasetBrowser(self.file_list, render=None)
+
         self.update_label_list(())
 
         self._img_explorer.children = [
             HBox([HBox([self.train_labels, self.test_labels])]),
-            self.file_list,
+            self.scan_status,
+            HBox([self.profile_button, self.duplicates_button]),
+            self.browser.box,
             self.output,
         ]
 
@@ -93,11 +110,50 @@ class Text(MLWidget):
         self.output.clear_output()
         with self.output:
             for path in args["new"]:
-                with open(path, "r", encoding="utf-8", errors="ignore") as fh:
-                    for i, x in enumerate(fh.readlines()):
-                        if i == 20:
-                            break
-                        print(x.strip())
+                for x in head(path, 20):
+                    print(x.strip())
+
+    @staticmethod
+    def _in_background(button, fun):
+        """Runs fun in a thread, with the button disabled until it is done"""
+
+        def run():
+            try:
+                fun()
+            finally:
+                button.disabled = False
+
+        button.disabled = True
+        threading.Thread(target=run, daemon=True).start()
+
+    def profile(self, *_):
+        self.output.clear_output()
+        with self.output:
+            profile = profile_corpus(
+                Path(self.training_repo.value), self.alphabet.value
+            )
+            print(profile.summary())
+            if self.characters.value:
+                print(
+                    "Suggested sequence (95% of documents): {}".format(
+                        profile.suggested_sequence()
+                    )
+                )
+            if self.nclasses.value == -1:
+                self.nclasses.value = len(profile.class_counts)
+            return profile
+
+    def duplicates(self, *_):
+        self.output.clear_output()
+        with self.output:
+            report = near_duplicates(
+                Path(self.training_repo.value),
+                Path(self.testing_repo.value)
+                if self.testing_repo.value
+                else None,
+            )
+            print(report.summary())
+            return report
 
     def update_train_file_list(self, *args):
         with self.output:
@@ -106,10 +162,7 @@ class Text(MLWidget):
             directory = (
                 Path(self.training_repo.value) / self.train_labels.value[0]
             )
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(directory.glob("**/*"), 10)
-            ]
+            self.browser.load_directory(directory)
             self.test_labels.value = []
 
     def update_test_file_list(self, *args):
@@ -119,10 +172,7 @@ class Text(MLWidget):
             directory = (
                 Path(self.testing_repo.value) / self.test_labels.value[0]
             )
-            self.file_list.options = [
-                fh.as_posix()
-                for fh in sample_from_iterable(directory.glob("**/*"), 10)
-            ]
+            self.browser.load_directory(directory)
             self.train_labels.value = []
 
     def _create_service_body(self):
@@ -177,7 +227,7 @@ class Text(MLWidget):
         return body
 
     def _train_body(self):
-        assert len(self.gpuid.index) > 0, "Set a GPU index"
+        assert len(self.gpuid.gpu_ids) > 0, "Set a GPU index"
         body = OrderedDict(
             [
                 ("service", self.sname),
@@ -189,9 +239,9 @@ class Text(MLWidget):
                             "gpu": True,
                             "resume": self.resume.value,
                             "gpuid": (
-                                list(self.gpuid.index)
-                                if len(self.gpuid.index) > 1
-                                else self.gpuid.index[0]
+                                list(self.gpuid.gpu_ids)
+                                if len(self.gpuid.gpu_ids) > 1
+                                else self.gpuid.gpu_ids[0]
                             ),
                             "solver": {
                                 "iterations": self.iterations.value,
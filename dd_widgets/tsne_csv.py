@@ -1,7 +1,6 @@
 from collections import OrderedDict
 from pathlib import Path
 
-import matplotlib.pyplot as plt
 import numpy as np
 from IPython.display import display
 
@@ -92,6 +91,8 @@ class TSNE_CSV(MLWidget):
         return body
 
     def plot(self, **kwargs):
+        import matplotlib.pyplot as plt
+
         self.output.clear_output()
         with self.output:
             p = np.stack(
@@ -1,7 +1,9 @@
 # fmt: off
 
+import html
 import json
 import logging
+import sqlite3
 import threading
 import time
 from collections import OrderedDict
@@ -12,13 +14,22 @@ from pathlib import Path
 from typing import Any, Dict, get_type_hints
 
 import requests
-from ipywidgets import (HTML, Button, Checkbox, Dropdown, FloatText, HBox,
-                        IntProgress, IntText, Label, Layout, Output,
-                        SelectMultiple, Tab)
+from ipywidgets import (HTML, Accordion, Button, Checkbox, Dropdown,
+                        FloatText, HBox, IntProgress, IntText, Label, Layout,
+                        Output, SelectMultiple, Tab)
 from ipywidgets import Text as TextWidget
 from ipywidgets import VBox
 
-from .loghandler import OutputWidgetHandler
+from .curves import LiveCurves
+from .experiments import default_store
+from .gpus import GPUTelemetry, gpu_inventory
+from .loghandler import (LazyJSON, LogTail, OutputWidgetHandler,
+                         record_filter, render_record, service_logfile)
+from .metrics import MetricRecorder, metrics_path
+from .scanning import Debouncer, DirectoryScanner
+from .stopping import (NonFinite, check_rules, for_training,
+                       keep_best_snapshot)
+from .tboard import EventWriter
 
 # fmt: on
 
@@ -58,27 +69,98 @@ class GPUSelect(SelectMultiple):
         if isinstance(kwargs["index"], int):
             kwargs["index"] = (kwargs["index"],)
 
-        try:
-            c = requests.get("http://{}:12345".format(host))
-            assert c.status_code == 200
-            SelectMultiple.__init__(
-                self,
-                *args,
-                options=list(
-                    "GPU {index} ({utilization}%)".format(
-                        index=x["index"], utilization=x["utilization.gpu"]
-                    )
-                    for x in c.json()["gpus"]
-                ),
-                **kwargs
-            )
-        except Exception:
-            SelectMultiple.__init__(
-                self,
-                *args,
-                options=list(range(8)),  # default, just in case
-                **kwargs
+        # the value is GPU ids, the index positions in the monitor's list
+        gpu_ids = kwargs.pop("index")
+        inventory = gpu_inventory(host)
+        gpus = inventory.get()
+        self._ids = self._gpu_ids(gpus)
+        SelectMultiple.__init__(
+            self,
+            *args,
+            options=["GPU {}".format(x) for x in self._ids],
+            **kwargs
+        )
+        self.gpu_ids = gpu_ids
+        # utilization apart from the options, which a change would unselect
+        self.utilization = Label(self._utilization(gpus))
+        inventory.subscribe(self._update_options)
+
+    @staticmethod
+    def _gpu_ids(gpus):
+        if gpus is None:
+            return list(range(8))  # until the monitor answers
+        return [x.index for x in gpus]
+
+    @staticmethod
+    def _utilization(gpus):
+        if gpus is None:
+            return ""
+        return ", ".join(
+            "{index}: {utilization:.0f}%".format(
+                index=x.index, utilization=x.utilization
             )
+            for x in gpus
+        )
+
+    @property
+    def gpu_ids(self):
+        """Ids of the selected GPUs, as DeepDetect expects in gpuid"""
+        return tuple(self._ids[i] for i in self.index)
+
+    @gpu_ids.setter
+    def gpu_ids(self, gpu_ids):
+        self.index = tuple(
+            self._ids.index(x) for x in gpu_ids if x in self._ids
+        )
+
+    def _update_options(self, gpus):
+        self.utilization.value = self._utilization(gpus)
+        ids = self._gpu_ids(gpus)
+        if ids == self._ids:
+            return
+        gpu_ids = self.gpu_ids
+        self._ids = ids
+        self.options = ["GPU {}".format(x) for x in ids]
+        self.gpu_ids = gpu_ids
+
+
+class LazyWidget:
+    """Stands for the widget of a rarely used parameter: holds its value
+    until the widget is actually displayed, then delegates to it"""
+
+    def __init__(self, factory, value) -> None:
+        self._factory = factory  # typing: Callable[[Any], Widget]
+        self._value = value
+        self._widget = None
+
+    @property
+    def widget(self):
+        if self._widget is None:
+            self._widget = self._factory(self._value)
+        return self._widget
+
+    @property
+    def value(self):
+        if self._widget is None:
+            return self._value
+        return self._widget.value
+
+    @value.setter
+    def value(self, value):
+        if self._widget is None:
+            self._value = value
+        else:
+            self._widget.value = value
+
+
+_layouts = {
+    "text": dict(min_width="20ex", margin="-2px 2px 4px 2px"),
+    "value": dict(width="100px", margin="4px 2px 4px 2px"),
+    "label": dict(min_width="180px"),
+    "row": dict(margin="4px 2px 4px 2px"),
+}
+
+_shared_layouts = {}  # typing: Dict[str, Layout]
 
 
 # -- Core 'abstract' widget for many tasks
@@ -100,19 +182,48 @@ class MLWidget:
         GPUIndex: GPUSelect,
     }
 
+    # Parameters whose widgets are only created when their section of the
+    # configuration is opened
+    _lazy_groups = OrderedDict(
+        [
+            (
+                "geometry",
+                [
+                    "all_effects",
+                    "persp_horizontal",
+                    "persp_vertical",
+                    "zoom_out",
+                    "zoom_in",
+                    "pad_mode",
+                    "persp_factor",
+                    "zoom_factor",
+                    "geometry_prob",
+                ],
+            ),
+            ("noise / distort", ["noise_prob", "distort_prob"]),
+        ]
+    )
+
     # host: TextWidget
     # port: TextWidget
 
+    @classmethod
+    def parameter_spec(cls):
+        """(name, type hint, default) of the parameters of __init__, computed
+        once per class"""
+        if "_parameter_spec" not in cls.__dict__:
+            fun = cls.__init__  # type: ignore
+            typing_dict = get_type_hints(fun)
+            cls._parameter_spec = tuple(
+                (param.name, typing_dict[param.name], param.default)
+                for param in signature(fun).parameters.values()
+                if param.name not in ("self", "sname")
+            )
+        return cls._parameter_spec
+
     def typing_info(self, local_vars: Dict[str, Any]):
-        fun = self.__init__  # type: ignore
-        typing_dict = get_type_hints(fun)
-        for param in signature(fun).parameters.values():
-            if param.name != "sname":
-                yield (
-                    param.name,
-                    eval(param.name, local_vars),
-                    typing_dict[param.name],
-                )
+        for name, type_hint, _ in self.parameter_spec():
+            yield name, local_vars[name], type_hint
 
     @property
     def status(self):
@@ -131,16 +242,54 @@ class MLWidget:
         self.status_label.value = ", ".join(label)
 
     def widgets_refresh(self, *_):
+        self._open_tab({"new": 2})
         with self.output:
-            from . import logfile_name
-            with open(logfile_name, "r") as fh:
-                l = fh.readlines()
+            if self._log_tail is None:
+                from . import logfile_name
+
+                service = self.tail_service.value or None
+                self._log_tail = LogTail(
+                    service_logfile(logfile_name, service),
+                    keep=record_filter(
+                        logging.getLevelName(self.tail_level.value), service
+                    ),
+                )
+            if len(self._log_tail.read()) > 0 or self.debug.value == "":
                 self.debug.value = (
                     "<code style='display: block; white-space: pre-wrap;'>"
-                    + "".join(l[-200:])
+                    + html.escape(
+                        "".join(render_record(x) for x in self._log_tail.lines)
+                    )
                     + "</code>"
                 )
 
+    def _tail_filter(self, *_):
+        self._log_tail = None
+        self.debug.value = ""
+        self.widgets_refresh()
+
+    def _tail_follow(self, change):
+        with self._follow_lock:
+            if not change["new"]:
+                self._following.clear()
+                return
+            self._following.set()
+            # a single follower per widget: one still running goes on
+            if self._follower is None:
+                self._follower = threading.Thread(
+                    target=self._follow_loop, daemon=True
+                )
+                self._follower.start()
+
+    def _follow_loop(self):
+        while True:
+            with self._follow_lock:
+                if not self._following.is_set():
+                    self._follower = None
+                    return
+            self.widgets_refresh()
+            time.sleep(1)
+
     def __init__(self, sname: str, local_vars: Dict[str, Any], *args) -> None:
 
         from . import logfile_name
@@ -149,6 +298,10 @@ class MLWidget:
         super().__init__(*args)
 
         self.sname = sname
+        # records of this service go to its own log file
+        self.logger = logging.LoggerAdapter(
+            logging.getLogger(), {"service": sname}
+        )
         self.output = Output(layout=Layout(max_width="650px"))
         self.pbar = IntProgress(
             min=0,
@@ -179,9 +332,26 @@ class MLWidget:
         self.stop_button.on_click(self.stop)
         self.hardclear_button.on_click(self.hardclear)
 
+        self._lazy_sections = OrderedDict()  # typing: Dict[str, List[str]]
         for name, value, type_hint in self.typing_info(local_vars):
             self._add_widget(name, value, type_hint)
 
+        # measures of the last training, kept across kernel restarts
+        self.metrics = MetricRecorder(self._metrics_path())
+        self.run_id = None  # typing: Optional[int], in the experiment store
+        # evaluated on each poll, a copy per training
+        self.stopping_rules = [NonFinite()]  # typing: List[StoppingRule]
+        self._rules = []  # typing: List[StoppingRule]
+
+        if len(self._lazy_sections) > 0:
+            self._accordion = Accordion(
+                [VBox() for _ in self._lazy_sections], selected_index=None
+            )
+            for i, title in enumerate(self._lazy_sections):
+                self._accordion.set_title(i, title)
+            self._accordion.observe(self._open_section, names="selected_index")
+            self._widgets.append(self._accordion)
+
         self._configuration = VBox(
             self._widgets, layout=Layout(min_width="250px")
         )
@@ -195,19 +365,29 @@ class MLWidget:
             [self.output], layout=Layout(min_height="800px", width="590px")
         )
 
-        self.debug = HTML(
-            layout={"width": "590px", "height": "800px", "border": "none"}
-        )
-        self.refresh_button = Button(description="Refresh")
-        self.refresh_button.on_click(self.widgets_refresh)
+        # the content of the log tail tab is created when first selected
+        self._tail = VBox()
+        self._log_tail = None  # typing: Optional[LogTail]
+        self._following = threading.Event()
+        self._follow_lock = threading.Lock()
+        self._follower = None  # typing: Optional[threading.Thread]
+        self.curves = LiveCurves()
         self._tabs.children = [
             self._img_explorer,
             info_loghandler.out,
-            VBox([self.refresh_button, self.debug]),
+            self._tail,
+            self.curves.box,
         ]
+        self._tabs.observe(self._open_tab, names="selected_index")
         self._tabs.set_title(0, "Exploration")
         self._tabs.set_title(1, "Logs (INFO)")
-        self._tabs.set_title(2, f"{logfile_name.split('/')[-1]} (tail)")
+        self._tabs.set_title(3, "Metrics")
+        self._tabs.set_title(
+            2,
+            "{} (tail)".format(
+                service_logfile(logfile_name, sname).split("/")[-1]
+            ),
+        )
 
         self.file_list = SelectMultiple(
             options=[],
@@ -217,55 +397,139 @@ class MLWidget:
             layout=Layout(height="200px", width="560px"),
         )
 
-    def _add_widget(self, name, value, type_hint):
+        self.scan_status = Label()
+        self._scan_messages = {}  # typing: Dict[str, str]
+        self._label_debouncer = Debouncer(self._scan_labels, 0.5)
+        self._train_scanner = DirectoryScanner(
+            lambda *args: self._labels_scanned("train", *args),
+            lambda path, n: self._scan_message(
+                "train", "Scanning {}: {} entries".format(path, n)
+            ),
+        )
+        self._test_scanner = DirectoryScanner(
+            lambda *args: self._labels_scanned("test", *args),
+            lambda path, n: self._scan_message(
+                "test", "Scanning {}: {} entries".format(path, n)
+            ),
+        )
 
+    def _open_tab(self, change):
+        if change["new"] == 3:
+            self.curves.update(self.metrics.history, force=True)
+        if change["new"] == 2 and len(self._tail.children) == 0:
+            self.debug = HTML(
+                layout={"width": "590px", "height": "800px", "border": "none"}
+            )
+            self.refresh_button = Button(description="Refresh")
+            self.refresh_button.on_click(self.widgets_refresh)
+            self.tail_follow = Checkbox(description="Follow", indent=False)
+            self.tail_follow.observe(self._tail_follow, names="value")
+            self.tail_level = Dropdown(
+                options=["DEBUG", "INFO", "WARNING", "ERROR"],
+                layout={"width": "100px"},
+            )
+            # the records of other services and without service are in the
+            # main log file
+            self.tail_service = Dropdown(
+                options=[(self.sname, self.sname), ("no service", "")],
+                layout={"width": "150px"},
+            )
+            self.tail_level.observe(self._tail_filter, names="value")
+            self.tail_service.observe(self._tail_filter, names="value")
+            self._tail.children = [
+                HBox(
+                    [
+                        self.refresh_button,
+                        self.tail_follow,
+                        self.tail_level,
+                        self.tail_service,
+                    ]
+                ),
+                self.debug,
+            ]
+
+    def _open_section(self, change):
+        if change["new"] is None:
+            return
+        section = self._accordion.children[change["new"]]
+        if len(section.children) == 0:
+            names = list(self._lazy_sections.values())[change["new"]]
+            section.children = [
+                self._widget_row(name, getattr(self, name).widget)
+                for name in names
+            ]
+
+    def _lazy_group(self, name):
+        for group, names in self._lazy_groups.items():
+            if name in names:
+                return group
+        return None
+
+    @staticmethod
+    def _layout(name):
+        """Layouts shared by all the parameter rows of all widgets"""
+        if name not in _shared_layouts:
+            _shared_layouts[name] = Layout(**_layouts[name])
+        return _shared_layouts[name]
+
+    def _make_widget(self, name, value, type_hint):
         widget_type = self._widget_type.get(type_hint, None)
 
         if widget_type is None:
+            return TextWidget(  # Widget type by default then convert to str
+                value="" if value is None else str(value),
+                layout=self._layout("text"),
+            )
+
+        default_params = dict(
+            value=type_hint() if value is None else (value),
+            layout=self._layout("value"),
+        )
+        if name == "gpuid":
+            default_params["host"] = self.host.value
+        return widget_type(**default_params)
+
+    def _widget_row(self, name, widget):
+        if isinstance(widget, TextWidget):
+            return VBox([Label(self._fields.get(name, name) + ":"), widget])
+        children = [
+            Label(self._fields.get(name, name), layout=self._layout("label")),
+            widget,
+        ]
+        if isinstance(widget, GPUSelect):
+            children.append(widget.utilization)
+        return HBox(children, layout=self._layout("row"))
+
+    def _add_widget(self, name, value, type_hint):
+
+        group = self._lazy_group(name)
+
+        if group is not None:
+            # same value as the widget would hold
+            if type_hint in (int, float, bool):
+                value = type_hint() if value is None else type_hint(value)
+            elif self._widget_type.get(type_hint, None) is None:
+                value = "" if value is None else str(value)
             setattr(
                 self,
                 name,
-                TextWidget(  # Widget type by default then convert to str
-                    value="" if value is None else str(value),
-                    layout=Layout(min_width="20ex", margin="-2px 2px 4px 2px"),
+                LazyWidget(
+                    lambda v: self._make_widget(name, v, type_hint), value
                 ),
             )
-            self._widgets.append(
-                VBox(
-                    [
-                        Label(self._fields.get(name, name) + ":"),
-                        getattr(self, name),
-                    ]
-                )
-            )
-        else:
-            default_params = dict(
-                value=type_hint() if value is None else (value),
-                layout=Layout(width="100px", margin="4px 2px 4px 2px"),
-            )
-            if name == "gpuid":
-                default_params["host"] = self.host.value
-            setattr(self, name, widget_type(**default_params))
+            self._lazy_sections.setdefault(group, []).append(name)
+            return
 
-            self._widgets.append(
-                HBox(
-                    [
-                        Label(
-                            self._fields.get(name, name),
-                            layout=Layout(min_width="180px"),
-                        ),
-                        getattr(self, name),
-                    ],
-                    layout=Layout(margin="4px 2px 4px 2px"),
-                )
-            )
+        setattr(self, name, self._make_widget(name, value, type_hint))
+        self._widgets.append(self._widget_row(name, getattr(self, name)))
 
     def _ipython_display_(self):
         self._main_elt._ipython_display_()
 
     def stop(self, *_):
-        info_loghandler.out.clear_output()
+        info_loghandler.clear()
         self.output.clear_output()
+        self.metrics.close()
         with self.output:
             request = sname_url.format(
                 host=self.host.value,
@@ -274,12 +538,10 @@ class MLWidget:
                 sname=self.sname,
             )
             c = requests.delete(request)
-            logging.info(
-                "Stop service {sname}: {json}".format(
-                    sname=self.sname, json=json.dumps(c.json(), indent=2)
-                )
-            )
             json_dict = c.json()
+            self.logger.info(
+                "Stop service %s: %s", self.sname, LazyJSON(json_dict)
+            )
             if "head" in json_dict:
                 self.status = json_dict["head"]
             print(json.dumps(json_dict, indent=2))
@@ -287,7 +549,7 @@ class MLWidget:
 
     def hardclear(self, *_):
         # The basic version
-        info_loghandler.out.clear_output()
+        info_loghandler.clear()
         self.output.clear_output()
         with self.output:
             MLWidget.create_service(self)
@@ -298,20 +560,20 @@ class MLWidget:
                 sname=self.sname,
             )
             c = requests.delete(request)
-            logging.info(
-                "Clearing (full) service {sname}: {json}".format(
-                    sname=self.sname, json=json.dumps(c.json(), indent=2)
-                )
+            json_dict = c.json()
+            self.logger.info(
+                "Clearing (full) service %s: %s",
+                self.sname,
+                LazyJSON(json_dict),
             )
 
-            json_dict = c.json()
             if "head" in json_dict:
                 self.status = json_dict["head"]
             print(json.dumps(json_dict, indent=2))
             # return json_dict
 
     def create_service(self, *_):
-        info_loghandler.out.clear_output()
+        info_loghandler.clear()
         with self.output:
             host = self.host.value
             port = self.port.value
@@ -339,10 +601,8 @@ class MLWidget:
                 ]
             )
 
-            logging.info(
-                "Creating service '{sname}':\n {body}".format(
-                    sname=self.sname, body=json.dumps(body, indent=2)
-                )
+            self.logger.info(
+                "Creating service '%s': %s", self.sname, LazyJSON(body)
             )
             c = requests.put(
                 sname_url.format(
@@ -351,122 +611,130 @@ class MLWidget:
                 json.dumps(body),
             )
 
-            if c.json()["status"]["code"] != 201:
-                logging.warning(
-                    "Reply from creating service '{sname}': {json}".format(
-                        sname=self.sname, json=json.dumps(c.json(), indent=2)
-                    )
+            json_dict = c.json()
+            if json_dict["status"]["code"] != 201:
+                self.logger.warning(
+                    "Reply from creating service '%s': %s",
+                    self.sname,
+                    LazyJSON(json_dict),
                 )
                 raise RuntimeError(
                     "Error code {code}: {msg}".format(
-                        code=c.json()["status"]["dd_code"],
-                        msg=c.json()["status"]["dd_msg"],
+                        code=json_dict["status"]["dd_code"],
+                        msg=json_dict["status"]["dd_msg"],
                     )
                 )
             else:
-                logging.info(
-                    "Reply from creating service '{sname}': {json}".format(
-                        sname=self.sname, json=json.dumps(c.json(), indent=2)
-                    )
+                self.logger.info(
+                    "Reply from creating service '%s': %s",
+                    self.sname,
+                    LazyJSON(json_dict),
                 )
 
-            json_dict = c.json()
             if "head" in json_dict:
                 self.status = json_dict["head"]
             print(json.dumps(json_dict, indent=2))
             return json_dict
 
     def run(self, *_):
-        logging.info("Entering run method")
+        self.logger.info("Entering run method")
         self.output.clear_output()
+        self.metrics.close()  # of the previous run, with its telemetry
 
         with self.output:
             host = self.host.value
             port = self.port.value
-            body = self._create_service_body()
-
-            logging.info(
-                "Sending request "
-                + sname_url.format(
-                    host=host, port=port, path=self.path.value, sname=self.sname
-                )
-            )
-            c = requests.get(
-                sname_url.format(
-                    host=host, port=port, path=self.path.value, sname=self.sname
-                )
+            body = service_body = self._create_service_body()
+            url = sname_url.format(
+                host=host, port=port, path=self.path.value, sname=self.sname
             )
-            logging.info(
-                "Current state of service '{sname}': {json}".format(
-                    sname=self.sname, json=json.dumps(c.json(), indent=2)
-                )
+
+            self.logger.info("Sending request %s", url)
+            c = requests.get(url)
+            json_dict = c.json()
+            self.logger.info(
+                "Current state of service '%s': %s",
+                self.sname,
+                LazyJSON(json_dict),
             )
-            if c.json()["status"]["msg"] != "NotFound":
+            if json_dict["status"]["msg"] != "NotFound":
                 # self.clear()
-                logging.warning(
-                    (
-                        "Since service '{sname}' was still there, "
-                        "it has been fully cleared: {json}"
-                    ).format(
-                        sname=self.sname, json=json.dumps(c.json(), indent=2)
-                    )
+                self.logger.warning(
+                    "Since service '%s' was still there, "
+                    "it has been fully cleared: %s",
+                    self.sname,
+                    LazyJSON(json_dict),
                 )
 
-            logging.info(
-                "Creating service '{sname}':\n {body}".format(
-                    sname=self.sname, body=json.dumps(body, indent=2)
-                )
-            )
-            c = requests.put(
-                sname_url.format(
-                    host=host, port=port, path=self.path.value, sname=self.sname
-                ),
-                json.dumps(body),
+            self.logger.info(
+                "Creating service '%s': %s", self.sname, LazyJSON(body)
             )
+            c = requests.put(url, json.dumps(body))
+            json_dict = c.json()
 
-            if c.json()["status"]["code"] != 201:
-                logging.warning(
-                    "Reply from creating service '{sname}': {json}".format(
-                        sname=self.sname, json=json.dumps(c.json(), indent=2)
-                    )
+            if json_dict["status"]["code"] != 201:
+                self.logger.warning(
+                    "Reply from creating service '%s': %s",
+                    self.sname,
+                    LazyJSON(json_dict),
                 )
                 raise RuntimeError(
                     "Error code {code}: {msg}".format(
-                        code=c.json()["status"]["dd_code"],
-                        msg=c.json()["status"]["dd_msg"],
+                        code=json_dict["status"]["dd_code"],
+                        msg=json_dict["status"]["dd_msg"],
                     )
                 )
             else:
-                logging.info(
-                    "Reply from creating service '{sname}': {json}".format(
-                        sname=self.sname, json=json.dumps(c.json(), indent=2)
-                    )
+                self.logger.info(
+                    "Reply from creating service '%s': %s",
+                    self.sname,
+                    LazyJSON(json_dict),
                 )
 
             body = self._train_body()
 
-            logging.info(
-                "Start training phase: {body}".format(
-                    body=json.dumps(body, indent=2)
-                )
-            )
+            self.logger.info("Start training phase: %s", LazyJSON(body))
             c = requests.post(
                 "http://{host}:{port}/{path}/train".format(
                     host=host, port=port, path=self.path.value
                 ),
                 json.dumps(body),
             )
-            logging.info(
-                "Reply from training service '{sname}': {json}".format(
-                    sname=self.sname, json=json.dumps(c.json(), indent=2)
-                )
+            json_dict = c.json()
+            self.logger.info(
+                "Reply from training service '%s': %s",
+                self.sname,
+                LazyJSON(json_dict),
             )
 
-            json_dict = c.json()
             if "head" in json_dict:
                 self.status = json_dict["head"]
             print(json.dumps(json_dict, indent=2))
 
+            self.run_id = self._record_run(service_body, body)
+            # TSNE widgets have no test_interval
+            test_interval = getattr(self, "test_interval", None)
+            self._rules = for_training(
+                self.stopping_rules,
+                None if test_interval is None else test_interval.value,
+            )
+
+            writer = None
+            if hasattr(self, "tboard") and self.tboard.value != "":
+                writer = EventWriter(Path(self.tboard.value) / self.sname)
+            telemetry = None
+            if hasattr(self, "gpuid") and len(self.gpuid.gpu_ids) > 0:
+                telemetry = GPUTelemetry(
+                    self.host.value, self.gpuid.gpu_ids, logger=self.logger
+                )
+            self.metrics = MetricRecorder(
+                self._metrics_path(),
+                resume=hasattr(self, "resume") and self.resume.value,
+                writer=writer,
+                telemetry=telemetry,
+            )
+            self.curves.reset()
+
             self.value = self.iterations.value
             self.pbar.bar_style = "info"
             self.pbar.max = self.iterations.value
@@ -475,22 +743,116 @@ class MLWidget:
             thread.start()
 
     def update_loop(self):
+        metrics = self.metrics
+        try:
+            self._update_loop()
+        finally:
+            # on errors too: the telemetry would poll the monitor forever
+            metrics.close()
+
+    def _update_loop(self):
 
+        last_status = "running"
         while True:
             info = self.info(print_output=False)
             self.pbar.bar_style = ""
-            status = info["head"]["status"]
+            status = info.get("head", {}).get("status", "")
+            measure = info.get("body", {}).get("measure", {}) or {}
+            if self.metrics.record(info):
+                self.curves.update(self.metrics.history)
+            if status != last_status and status != "finished":
+                self._record_event(status)
+            last_status = status
+
+            stop = check_rules(self._rules, measure, self.metrics.history)
+            if status == "running" and stop is not None:
+                self._early_stop(stop, info)
+                break
 
             if status == "finished":
+                self.metrics.close()
+                self._record_finish(status, measure)
+                self.curves.update(self.metrics.history, force=True)
                 self.pbar.value = self.iterations.value
                 self.pbar.bar_style = "success"
                 self.on_finished(info)
                 break
 
-            self.pbar.value = info["body"]["measure"].get("iteration", 0)
+            if status != "running":  # error, or the job is gone
+                self.metrics.close()
+                self._record_finish(status or "unknown", measure)
+                self.curves.update(self.metrics.history, force=True)
+                self.pbar.bar_style = "danger"
+                break
+
+            self.pbar.value = measure.get("iteration", 0)
 
             time.sleep(1)
 
+    def _early_stop(self, stop, info):
+        self.stop()
+        kept = keep_best_snapshot(self.model_repo.value, stop.iteration)
+        self.logger.warning(
+            "Stopped service %s: %s, best snapshot kept: %s",
+            self.sname,
+            stop.reason,
+            ", ".join(kept) or "none",
+        )
+        self.metrics.close()
+        self._record_finish("stopped", info["body"]["measure"], stop.reason)
+        self.curves.update(self.metrics.history, force=True)
+        self.pbar.bar_style = "warning"
+        self.status_label.value = "stopped: {}".format(stop.reason)
+
+    def parameter_values(self) -> Dict[str, Any]:
+        """Values of the parameters of __init__, as the widgets hold them"""
+        return {
+            name: getattr(self, name).gpu_ids
+            if name == "gpuid"
+            else getattr(self, name).value
+            for name, _, _ in self.parameter_spec()
+        }
+
+    def _record_run(self, service_body, train_body):
+        try:
+            store = default_store()
+            run = store.start_run(
+                self.sname,
+                self.__class__.__name__,
+                self.parameter_values(),
+                service_body,
+                train_body,
+                host=self.host.value,
+                port=self.port.value,
+            )
+        except (sqlite3.Error, OSError) as e:
+            self.logger.warning("Run not recorded: %s", e)
+            return None
+        # walking the dataset would hold the kernel
+        store.record_dataset(run, self.training_repo.value)
+        return run
+
+    def _record_event(self, status, message=""):
+        if self.run_id is not None:
+            try:
+                default_store().event(self.run_id, status, message)
+            except sqlite3.Error as e:
+                self.logger.warning("Event not recorded: %s", e)
+
+    def _record_finish(self, status, measure, reason=None):
+        if self.run_id is not None:
+            try:
+                default_store().finish_run(
+                    self.run_id, status, measure, reason
+                )
+            except sqlite3.Error as e:
+                self.logger.warning("Run end not recorded: %s", e)
+
+    def _metrics_path(self):
+        return metrics_path(
+            self.host.value, self.port.value, self.sname, self.model_repo.value
+        )
+
     def on_finished(self, info):
         # a minima...
         self.last_info = info
@@ -508,13 +870,13 @@ class MLWidget:
                 )
             )
             c = requests.get(request)
-            logging.debug(
-                "Getting info for service {sname}: {json}".format(
-                    sname=self.sname, json=json.dumps(c.json(), indent=2)
-                )
+            json_dict = c.json()
+            self.logger.debug(
+                "Getting info for service %s: %s",
+                self.sname,
+                LazyJSON(json_dict),
             )
 
-            json_dict = c.json()
             if "head" in json_dict:
                 self.status = json_dict["head"]
             if print_output:
@@ -522,21 +884,36 @@ class MLWidget:
             return json_dict
 
     def update_label_list(self, _):
-        with self.output:
-            if self.training_repo.value != "":
-                self.train_labels.options = tuple(
-                    sorted(
-                        f.stem for f in Path(self.training_repo.value).glob("*")
-                    )
-                )
-                self.train_labels.rows = min(10, len(self.train_labels.options))
+        # Fired on every keystroke in the repository fields: wait for the
+        # typing to stop, then list the labels in background threads
+        self._label_debouncer()
+
+    def _scan_labels(self):
+        for repo, scanner in (
+            (self.training_repo, self._train_scanner),
+            (self.testing_repo, self._test_scanner),
+        ):
+            if repo.value != "":
+                scanner.scan(repo.value)
+            else:
+                scanner.cancel()
 
-            if self.testing_repo.value != "":
-                self.test_labels.options = tuple(
-                    sorted(
-                        f.stem for f in Path(self.testing_repo.value).glob("*")
-                    )
-                )
-                self.test_labels.rows = min(10, len(self.test_labels.options))
-            if self.nclasses.value == -1:
-                self.nclasses.value = str(len(self.train_labels.options))
+    def _scan_message(self, name, message):
+        self._scan_messages[name] = message
+        self.scan_status.value = " ".join(
+            m for m in self._scan_messages.values() if m
+        )
+
+    def _labels_scanned(self, name, path, names, message):
+        with self.output:
+            labels = getattr(self, name + "_labels")
+            # list files have no labels to select
+            if not isinstance(labels, SelectMultiple):
+                return
+            self._scan_message(
+                name, "{}: {}".format(path, message) if message else ""
+            )
+            labels.options = tuple(names)
+            labels.rows = min(10, len(names))
+            if name == "train" and self.nclasses.value == -1:
+                self.nclasses.value = str(len(names))
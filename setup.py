@@ -9,5 +9,5 @@ setup(
     description="IPython widgets for deepdetect",
     packages=["dd_widgets"],
     install_requires=requirements,
-    python_requires=">=3.5",
+    python_requires=">=3.7",
 )